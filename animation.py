@@ -0,0 +1,148 @@
+import pygame
+from collections import deque
+from constants import *
+
+
+def linear(t):
+    return t
+
+
+def ease_in_quad(t):
+    # Accelerates like a falling object
+    return t * t
+
+
+class Tween:
+    """
+    Moves (and optionally fades) one tile image from start_pos to end_pos over duration seconds.
+    Positions are in board space (see Board.cell_position); draw() shifts them by the board's screen offset.
+    """
+
+    def __init__(self, piece, start_pos, end_pos, duration, start_alpha=255, end_alpha=255, easing=linear,
+                 size=TILE_SIZE):
+        self.piece = piece
+        self.size = size
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        self.duration = duration
+        self.start_alpha = start_alpha
+        self.end_alpha = end_alpha
+        self.easing = easing
+        self.elapsed = 0.0
+        self._faded_surface = None  # Per-tween copy so set_alpha doesn't touch the shared image
+
+    @property
+    def done(self):
+        return self.elapsed >= self.duration
+
+    def update(self, dt):
+        self.elapsed = min(self.duration, self.elapsed + dt)
+
+    def _progress(self):
+        return self.easing(self.elapsed / self.duration) if self.duration > 0 else 1.0
+
+    def _position(self, t):
+        return (self.start_pos[0] + (self.end_pos[0] - self.start_pos[0]) * t,
+                self.start_pos[1] + (self.end_pos[1] - self.start_pos[1]) * t)
+
+    def rect(self, offset=(0, 0)):
+        """Screen area the tile covers at its current progress."""
+        x, y = self._position(self._progress())
+        # +1 covers sub-pixel rounding
+        return pygame.Rect(int(x + offset[0]), int(y + offset[1]), self.size + 1, self.size + 1)
+
+    def draw(self, screen, images, offset=(0, 0)):
+        image = images.get(self.piece)
+        if image is None:
+            return
+        t = self._progress()
+        alpha = self.start_alpha + (self.end_alpha - self.start_alpha) * t
+        if alpha < 255:
+            if self._faded_surface is None:
+                self._faded_surface = image.copy()
+            self._faded_surface.set_alpha(int(alpha))
+            image = self._faded_surface
+        x, y = self._position(t)
+        screen.blit(image, (x + offset[0], y + offset[1]))
+
+
+class ShakeTween(Tween):
+    """Wiggles a tile horizontally around its cell, used for invalid swaps."""
+    OFFSETS = [0, 5, -5, 3, -3, 0]
+
+    def __init__(self, piece, pos, duration, direction=1, size=TILE_SIZE):
+        super().__init__(piece, pos, pos, duration, size=size)
+        self.direction = direction
+
+    def _position(self, t):
+        # Piecewise-linear interpolation through OFFSETS
+        scaled = t * (len(self.OFFSETS) - 1)
+        i = min(int(scaled), len(self.OFFSETS) - 2)
+        offset = self.OFFSETS[i] + (self.OFFSETS[i + 1] - self.OFFSETS[i]) * (scaled - i)
+        return self.start_pos[0] + offset * self.direction, self.start_pos[1]
+
+
+class AnimationPhase:
+    """
+    A group of tweens that play concurrently over a static board snapshot (cells).
+    on_start runs when the phase begins, e.g. to add the score of a cascade step.
+    """
+
+    def __init__(self, tweens, cells=None, on_start=None):
+        self.tweens = tweens
+        self.cells = cells
+        self.on_start = on_start
+        self.started = False
+
+    @property
+    def remaining(self):
+        return max([tween.duration - tween.elapsed for tween in self.tweens], default=0.0)
+
+
+class AnimationTimeline:
+    """
+    Queue of animation phases advanced by the main loop once per frame with the frame's
+    delta time. Nothing here blocks, so input and the timer keep running while it plays.
+    """
+
+    def __init__(self):
+        self._phases = deque()
+
+    @property
+    def busy(self):
+        return bool(self._phases)
+
+    def clear(self):
+        self._phases.clear()
+
+    def add_phase(self, tweens, cells=None, on_start=None):
+        self._phases.append(AnimationPhase(tweens, cells, on_start))
+
+    def update(self, dt):
+        # Leftover time from a finished phase carries into the next one
+        while self._phases:
+            phase = self._phases[0]
+            if not phase.started:
+                phase.started = True
+                if phase.on_start:
+                    phase.on_start()
+            step = min(dt, phase.remaining)
+            for tween in phase.tweens:
+                tween.update(step)
+            dt -= step
+            if phase.remaining > 0:
+                break
+            self._phases.popleft()
+
+    def current_cells(self):
+        """Board snapshot the current phase plays over, or None when idle."""
+        return self._phases[0].cells if self._phases else None
+
+    def rects(self, offset=(0, 0)):
+        """Screen rects covered by the tweens of the current phase."""
+        return [tween.rect(offset) for tween in self._phases[0].tweens] if self._phases else []
+
+    def draw(self, screen, images, offset=(0, 0)):
+        if self._phases:
+            for tween in self._phases[0].tweens:
+                tween.draw(screen, images, offset)
@@ -0,0 +1,242 @@
+import json
+import re
+import struct
+import sys
+import threading
+from collections import OrderedDict, deque
+import pygame
+from constants import *
+
+# Browsers (pygbag) have no threads, there preloading is done a few images per frame via pump()
+THREADS_AVAILABLE = sys.platform != "emscripten"
+
+
+BUNDLE_MAGIC = b"M3A"
+BUNDLE_VERSION = 1
+_BUNDLE_HEADER = struct.Struct("<3sBI")
+
+
+def theme_image_paths(theme_pieces):
+    """Image files a Board with these pieces needs: the theme's tiles plus all special tiles."""
+    return [f"{piece}.png" for piece in theme_pieces] + [f"{path}.png" for path in SPECIAL_TILE_IMAGES.values()]
+
+
+def write_bundle(path, images):
+    """
+    Writes pre-scaled images, {(image path, size): surface}, into one bundle file:
+    header (magic, version u8, index length u32), a JSON index of [image path, size, offset]
+    and then every image's raw RGBA pixels, offsets counted from the end of the index.
+    """
+    index = []
+    pixels = []
+    offset = 0
+    for (image_path, size), surface in images.items():
+        index.append([image_path, size, offset])
+        pixels.append(pygame.image.tobytes(surface, "RGBA"))
+        offset += len(pixels[-1])
+    index_bytes = json.dumps(index).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(_BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(index_bytes)))
+        f.write(index_bytes)
+        f.write(b"".join(pixels))
+
+
+def read_bundle(data):
+    """
+    {(image path, size): memoryview of its RGBA pixels} for the bytes of a bundle file; slices, no copies.
+    Images whose pixels run past the end of data (a truncated file) are left out, so they are loaded from
+    their PNGs instead.
+    """
+    magic, version, index_length = _BUNDLE_HEADER.unpack_from(data)
+    if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+        raise ValueError(f"Not a version {BUNDLE_VERSION} asset bundle")
+    start = _BUNDLE_HEADER.size + index_length
+    index = json.loads(bytes(data[_BUNDLE_HEADER.size:start]))
+    view = memoryview(data)
+    return {(image_path, size): view[start + offset:start + offset + size * size * 4]
+            for image_path, size, offset in index if start + offset + size * size * 4 <= len(data)}
+
+
+class ImageCache:
+    """
+    Process-wide cache of tile images scaled to a size, keyed by (path, size), with LRU eviction.
+
+    preload() decodes and scales images off the main thread so a later get() does no disk I/O;
+    get() converts them for the display on first use (that part must happen on the main thread).
+    Images found in a loaded bundle (see load_bundle) skip the decoding and scaling.
+    """
+
+    def __init__(self, max_entries=IMAGE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (path, size) -> [surface, converted_for_display]
+        self._errors = {}  # (path, size) -> pygame.error raised while preloading
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._bundle = {}  # (path, size) -> RGBA pixels
+
+    def get(self, path, size):
+        """Returns the image at path scaled to size x size. Raises pygame.error if it can't be loaded."""
+        key = (path, size)
+        with self._lock:
+            entry = self._entries.get(key)
+            error = self._errors.pop(key, None)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if error is not None:
+            raise error
+        if entry is None:
+            entry = [self._load(path, size), False]
+            self._store(key, entry)
+        if not entry[1]:
+            entry[0] = entry[0].convert_alpha()
+            entry[1] = True
+        return entry[0]
+
+    def load_bundle(self, path):
+        """
+        Reads an asset bundle written by build_assets.py in one go. Returns False if there is none;
+        images are then decoded from their PNGs as usual.
+        """
+        try:
+            with open(path, "rb") as f:
+                bundle = read_bundle(f.read())
+        except (OSError, ValueError, struct.error) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Warning: Could not read asset bundle {path}. Error: {e}")
+            return False
+        with self._lock:
+            self._bundle = bundle
+        return True
+
+    def preload(self, paths, size):
+        """Queues images for background loading; already cached ones are skipped."""
+        with self._lock:
+            for path in paths:
+                key = (path, size)
+                if key not in self._entries and key not in self._pending:
+                    self._pending.append(key)
+            # _worker is only cleared under the lock once the worker has seen the queue empty, so keys
+            # queued here are either picked up by the running worker or by a new one
+            if THREADS_AVAILABLE and self._pending and self._worker is None:
+                self._worker = threading.Thread(target=self._drain_pending, daemon=True)
+                self._worker.start()
+
+    def pump(self, max_images=1):
+        """Loads up to max_images queued images on the calling thread (for platforms without threads)."""
+        for _ in range(max_images):
+            if not self._load_next_pending():
+                break
+
+    def ready(self, paths, size):
+        """True once every image in paths is loaded at size (or failed to, get() then raises the error)."""
+        with self._lock:
+            return all((path, size) in self._entries or (path, size) in self._errors for path in paths)
+
+    @property
+    def loading(self):
+        return bool(self._pending) or self._worker is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._errors.clear()
+            self._pending.clear()
+
+    def _drain_pending(self):
+        while self._load_next_pending(worker=True):
+            pass
+
+    def _load_next_pending(self, worker=False):
+        with self._lock:
+            if not self._pending:
+                if worker:
+                    self._worker = None  # Done; the next preload() starts a new worker
+                return False
+            key = self._pending.popleft()
+            if key in self._entries:
+                return True
+        try:
+            self._store(key, [self._load(*key), False])
+        except (pygame.error, OSError, ValueError) as e:
+            with self._lock:
+                self._errors[key] = e
+        return True
+
+    def _load(self, path, size):
+        try:
+            pixels = self._bundle.get((path, size))
+            if pixels is not None:
+                try:
+                    # A view of the bundle's pixels; get() converts it for the display, which copies it
+                    return pygame.image.frombuffer(pixels, (size, size), "RGBA")
+                except ValueError:
+                    pass  # Bad slice, fall back to the PNG
+            # Decoding and scaling are pure software and safe off the main thread
+            return pygame.transform.scale(pygame.image.load(path), (size, size))
+        except (OSError, ValueError) as e:
+            # A missing file or a short bundle slice; callers of get() only handle pygame.error
+            raise pygame.error(f"{path}: {e}") from e
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Shared by every Board so restarting a game or switching themes reuses decoded images
+image_cache = ImageCache()
+
+
+class TextCache:
+    """
+    Rendered text surfaces keyed by (text, font, color), with LRU eviction.
+
+    Digits are rendered and cached one glyph at a time and the rest of the text in runs between them,
+    so "Score: 1230" after "Score: 1220" is only blits of surfaces that already exist.
+    """
+
+    _SEGMENT = re.compile(r"\d|\D+")
+
+    def __init__(self, max_entries=TEXT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (text, font, color) -> surface
+
+    def render(self, text, font, color):
+        """The whole text as one cached surface, like font.render(text, True, color)."""
+        key = (text, font, color)
+        surface = self._entries.get(key)
+        if surface is None:
+            surface = font.render(text, True, color)
+            self._entries[key] = surface
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return surface
+
+    def draw(self, screen, text, font, color, **anchor):
+        """
+        Blits text positioned by one pygame.Rect keyword (center=, topleft=, topright=, ...)
+        and returns the rect it covers.
+        """
+        segments = [self.render(segment, font, color) for segment in self._SEGMENT.findall(text)]
+        rect = pygame.Rect(0, 0, sum(segment.get_width() for segment in segments), font.get_height())
+        for name, value in anchor.items():
+            setattr(rect, name, value)
+        x = rect.x
+        blits = []
+        for segment in segments:
+            blits.append((segment, (x, rect.y)))
+            x += segment.get_width()
+        screen.blits(blits, doreturn=False)
+        return rect
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Shared by the HUD, the menu screens and the profiler overlay
+text_cache = TextCache()
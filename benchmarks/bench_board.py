@@ -0,0 +1,230 @@
+"""
+Benchmarks for the Board hot paths.
+
+    python benchmarks/bench_board.py                  # run and compare against baseline.json
+    python benchmarks/bench_board.py --save-baseline  # run and overwrite baseline.json
+
+Each case reports the time per call in microseconds, measured over --rounds rounds (default 20). Every round
+times all cases in turn, each right after a fixed reference workload, and a case's time is taken relative to
+the reference's (see measure). A shared machine can run 1.5-2x slower for seconds or minutes at a time; the
+ratio cancels that out, and the baseline times are scaled by how the reference workload's time compares to
+the baseline's. A case is flagged as a regression when it is slower than the baseline by more than
+--tolerance (default 25%) and by more than --noise-floor (default 5 us, as sub-microsecond cases jitter by
+more than 25% between runs), and the script then exits with status 1. Baselines are machine specific, so regenerate
+baseline.json on the machine you compare on.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+from board_state import BoardState
+from constants import *
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = [7, 16, 32, 64]
+SPECIAL_DENSITY = 0.3  # Share of cells turned into specials for the "specials" boards
+REFERENCE_CASE = "reference"  # See reference_workload
+REFERENCE_CALLS = 5  # Reference workload calls timed before each case in each round
+
+
+def make_board(size, specials):
+    board = BoardState(THEMES["Classic"], rows=size)
+    if specials:
+        for row in range(size):
+            for col in range(size):
+                if random.random() < SPECIAL_DENSITY:
+                    board.set_piece(row, col, random.choice(ALL_SPECIAL_TILE_TYPES))
+        board.has_valid_moves()  # Settle the move index
+    return board
+
+
+def median_time(setup, call, calls):
+    times = []
+    for _ in range(calls):
+        args = setup()
+        start = time.perf_counter()
+        call(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def measure(cases, rounds):
+    """
+    Seconds per call for each case, {name: seconds}, plus the reference workload's under
+    REFERENCE_CASE. cases is a list of (name, setup, call, samples); setup runs before every call
+    and is not timed.
+
+    Each round times every case in turn, the median of its calls, right after the reference
+    workload, and keeps the ratio of the two: both ran at whatever speed the machine had at that
+    moment. The median ratio over the rounds is turned back into seconds at the reference
+    workload's best time (other processes only ever make it slower).
+    """
+    ratios = {}
+    best_reference = None
+    for round_index in range(rounds):
+        for name, setup, call, case_samples in cases:
+            reference = median_time(tuple, reference_workload, REFERENCE_CALLS)
+            # Seeded per case and round so a case measures the same boards no matter which sizes are run
+            random.seed(f"{name}/{round_index}")
+            ratio = median_time(setup, call, max(3, case_samples // rounds)) / reference
+            ratios.setdefault(name, []).append(ratio)
+            best_reference = reference if best_reference is None else min(best_reference, reference)
+    results = {name: statistics.median(case_ratios) * best_reference for name, case_ratios in ratios.items()}
+    results[REFERENCE_CASE] = best_reference
+    return results
+
+
+def punch_holes(board, share=0.1):
+    # Clear a share of random cells, as a cascade step would
+    cells = {(random.randrange(board.rows), random.randrange(board.cols))
+             for _ in range(max(3, int(board.rows * board.cols * share)))}
+    board.remove_tiles(cells)
+    return cells
+
+
+def board_cases(size, specials, samples):
+    """(name, setup, call, samples) for every case on one board."""
+    random.seed(f"{size}/{specials}")
+    board = make_board(size, specials)
+    stable_cells = board.cells.copy()
+    label = f"n={size}/{'specials' if specials else 'plain'}"
+
+    def restore():
+        board.cells = stable_cells.copy()
+        board._rebuild_piece_index()
+        board._rebuild_move_index()
+        return ()
+
+    def random_swap():
+        restore()
+        row, col = random.randrange(size), random.randrange(size - 1)
+        board.swap_tiles((row, col), (row, col + 1))
+        return ({(row, col), (row, col + 1)},)
+
+    def holes():
+        restore()
+        punch_holes(board)
+        return ()
+
+    def holes_dropped():
+        holes()
+        board.drop_pieces()
+        return ()
+
+    cases = [
+        (f"check_match/full/{label}", restore, lambda: board.check_match(), samples),
+        (f"check_match/local/{label}", random_swap, lambda dirty: board.check_match(dirty_cells=dirty), samples),
+        (f"has_valid_moves/clean/{label}", restore, board.has_valid_moves, samples),
+        (f"has_valid_moves/after_swap/{label}", random_swap, lambda dirty: board.has_valid_moves(), samples),
+        (f"drop_pieces/{label}", holes, board.drop_pieces, samples),
+        (f"refill_grid/{label}", holes_dropped, board.refill_grid, samples),
+        (f"reshuffle_board/{label}", restore, board.reshuffle_board, samples // 10),
+    ]
+
+    for special_type in ALL_SPECIAL_TILE_TYPES:
+        def place_special(special_type=special_type):
+            restore()
+            row, col = random.randrange(size), random.randrange(size)
+            board.set_piece(row, col, special_type)
+            return row, col, random.choice(board.theme_pieces)
+
+        name = special_type.split("/")[-1]
+        cases.append((f"get_tiles_to_clear_from_special/{name}/{label}", place_special,
+                      board.get_tiles_to_clear_from_special, samples))
+    return cases
+
+
+def reference_workload():
+    """
+    Fixed work in the style of the board code (small numpy arrays, cell sets, a Python loop) that
+    never changes with it. Timed with the cases, it tells how fast the machine is running right now.
+    """
+    cells = np.arange(64, dtype=np.int8).reshape(8, 8) % 5
+    found = set()
+    for row in range(8):
+        for col in range(6):
+            if cells[row, col] == cells[row, col + 1]:
+                found.add((row, col))
+    return len(found) + int(np.count_nonzero(cells == 3))
+
+
+def run_cases(sizes, samples, rounds):
+    cases = [case for size in sizes for specials in (False, True) for case in board_cases(size, specials, samples)]
+    # Seconds -> microseconds
+    return {name: round(seconds * 1e6, 2) for name, seconds in measure(cases, rounds).items()}
+
+
+def compare(results, baseline, tolerance, noise_floor):
+    # A shared machine can run the whole suite 1.5-2x slower for minutes at a time. Baselines are
+    # scaled by how the reference workload's time compares, so only the board code's own changes count.
+    speed = results[REFERENCE_CASE] / baseline[REFERENCE_CASE] if REFERENCE_CASE in baseline else 1.0
+    print(f"Reference workload {speed:.2f}x the baseline's time, baselines below are scaled by that")
+    regressions = []
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if base is not None:
+            base = round(base * speed, 2)
+        if base is None:
+            status = "new"
+        elif value - base > max(base * tolerance, noise_floor):
+            status = "REGRESSION"
+            regressions.append(name)
+        elif base - value > max(base * tolerance, noise_floor):
+            status = "faster"
+        else:
+            status = "ok"
+        base_text = f"{base:>10.2f}" if base is not None else " " * 10
+        print(f"{name:<60} {value:>10.2f} us  baseline {base_text} us  {status}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Board hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="grid sizes to run")
+    parser.add_argument("--samples", type=int, default=400, help="timed calls per case, over all rounds")
+    parser.add_argument("--rounds", type=int, default=20, help="rounds per case, the best one counts")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging")
+    parser.add_argument("--noise-floor", type=float, default=5.0,
+                        help="differences under this many microseconds are never flagged")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    pygame.init()  # Dummy video driver, so this works headless
+    results = run_cases(args.sizes, args.samples, args.rounds)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    except (FileNotFoundError, ValueError, KeyError):
+        baseline = {}
+    regressions = compare(results, baseline, args.tolerance, args.noise_floor)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": {"python": platform.python_version(), "numpy": np.__version__,
+                                   "pygame": pygame.version.ver, "platform": platform.platform()},
+                       "unit": "microseconds per call (best round median)",
+                       "results": results}, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.tolerance:.0%} and {args.noise_floor:g} us: "
+              f"{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Bitboards for the match rules: one Python int per regular piece code with a bit set for every cell
+holding that piece, plus one for the cells holding any special tile. Runs and valid swaps are then found with a few shifts and ANDs per piece code,
+over the whole board at once, instead of comparing cells one by one.
+
+Cell (r, c) is bit r * stride + c with stride = cols + 2. The two guard columns to the right of
+each row are always clear, so shifting by one or two cells never carries a piece into the next row.
+"""
+import numpy as np
+
+
+class Bitboards:
+    """
+    Per-code bitboards of a rows x cols board for codes 1..code_limit - 1 (regular pieces). Codes from
+    code_limit up (special tiles) share the one specials bitboard.
+    """
+
+    def __init__(self, rows, cols, code_limit):
+        self.rows = rows
+        self.cols = cols
+        self.code_limit = code_limit
+        self.stride = cols + 2
+        row_bits = (1 << cols) - 1
+        self.board_mask = sum(row_bits << (row * self.stride) for row in range(rows))
+        self._column_bits = sum(1 << (row * self.stride) for row in range(rows))
+        # Cells a swap with the right / lower neighbour can start from
+        self._h_swap_cells = self.board_mask & ~self.line_mask(cols=[cols - 1])
+        self._v_swap_cells = self.board_mask & ~self.line_mask(rows=[rows - 1])
+        self.boards = {}  # code -> int
+        self.specials = 0
+
+    def bit(self, row, col):
+        return 1 << (row * self.stride + col)
+
+    def load(self, cells):
+        """Rebuilds every bitboard from a code array, all codes in one numpy pass."""
+        padded = np.zeros((self.rows, self.stride), dtype=cells.dtype)
+        padded[:, :self.cols] = cells
+        padded = padded.ravel()
+        codes = np.flatnonzero(np.bincount(padded)[:self.code_limit])
+        codes = codes[codes > 0]
+        packed = np.packbits(padded == codes[:, None], axis=1, bitorder="little")
+        self.boards = {code: int.from_bytes(bits.tobytes(), "little") for code, bits in zip(codes.tolist(), packed)}
+        self.specials = int.from_bytes(np.packbits(padded >= self.code_limit, bitorder="little").tobytes(), "little")
+
+    def move(self, old_code, new_code, cell):
+        # cell changes from old_code to new_code
+        bit = self.bit(*cell)
+        if 0 < old_code < self.code_limit:
+            self.boards[old_code] &= ~bit
+        elif old_code >= self.code_limit:
+            self.specials &= ~bit
+        if 0 < new_code < self.code_limit:
+            self.boards[new_code] = self.boards.get(new_code, 0) | bit
+        elif new_code >= self.code_limit:
+            self.specials |= bit
+
+    def line_mask(self, rows=(), cols=()):
+        """Bits of every cell in the given rows and columns."""
+        mask = 0
+        row_bits = (1 << self.cols) - 1
+        for row in rows:
+            mask |= row_bits << (row * self.stride)
+        for col in cols:
+            mask |= self._column_bits << col
+        return mask
+
+    def run_starts(self):
+        """(h, v): bits of the cells where a horizontal / vertical run of 3 or more equal pieces starts."""
+        s = self.stride
+        h = v = 0
+        for board in self.boards.values():
+            h |= board & (board >> 1) & (board >> 2)
+            v |= board & (board >> s) & (board >> 2 * s)
+        return h, v
+
+    def run_cells(self, h, v):
+        """Bits of every cell in the runs that start at h / v (as returned by run_starts)."""
+        s = self.stride
+        return h | (h << 1) | (h << 2) | v | (v << s) | (v << 2 * s)
+
+    def swap_masks(self):
+        """
+        (h, v): bit (r, c) of h is set if swapping (r, c) with (r, c + 1) makes a 3-run, of v the
+        same for (r + 1, c). For each piece code, a piece arriving at a cell makes a run if the two
+        cells beyond it in its direction of travel, or two of the cells across it, hold the same piece.
+        """
+        s = self.stride
+        h = v = 0
+        for b in self.boards.values():
+            left, left2, right, right2 = b << 1, b << 2, b >> 1, b >> 2
+            up, up2, down, down2 = b << s, b << 2 * s, b >> s, b >> 2 * s
+            across_h = (up & (up2 | down)) | (down & down2)  # Pieces above/below complete the run
+            across_v = (left & (left2 | right)) | (right & right2)  # Pieces left/right complete the run
+            # Swaps bit (r, c) stands for: the right (lower) neighbour moving into (r, c), then the
+            # piece at (r, c) moving into the neighbour, whose result is shifted back to (r, c)
+            h |= right & (left & left2 | across_h)
+            h |= (left & (right & right2 | across_h)) >> 1
+            v |= down & (up & up2 | across_v)
+            v |= (up & (down & down2 | across_v)) >> s
+        return h & self._h_swap_cells, v & self._v_swap_cells
+
+    def special_swap_masks(self):
+        """(h, v) as in swap_masks, for the swaps that move a special tile (either cell holds one)."""
+        s = self.stride
+        return ((self.specials | self.specials >> 1) & self._h_swap_cells,
+                (self.specials | self.specials >> s) & self._v_swap_cells)
+
+    def cells(self, mask):
+        """(row, col) of every set bit, row-major."""
+        cells = []
+        while mask:
+            low = mask & -mask
+            index = low.bit_length() - 1
+            cells.append(divmod(index, self.stride))
+            mask ^= low
+        return cells
+
+    def copy(self):
+        clone = object.__new__(Bitboards)
+        clone.__dict__.update(self.__dict__)
+        clone.boards = dict(self.boards)
+        return clone
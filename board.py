@@ -1,27 +1,33 @@
 import pygame
-import random
-import copy
+import numpy as np
+from assets import image_cache
+from board_state import BoardState
 from constants import *
 
 
-class Board:
-    def __init__(self, theme_pieces):
-        self.grid_size = GRID_SIZE
-        self.tile_size = TILE_SIZE
-        self.padding = PADDING
-        self.theme_pieces = theme_pieces  # Regular pieces
-        self.all_possible_pieces = list(theme_pieces)  # Used for refilling
-        self.images = self._load_all_tile_images()
-        self.grid = self._create_initial_grid()
+class Board(BoardState):
+    """BoardState plus the tile images and drawing; needs an initialized pygame display."""
+
+    def __init__(self, theme_pieces, rows=GRID_SIZE, cols=None, tile_size=TILE_SIZE, padding=PADDING, viewport=None,
+                 seed=None):
+        self.tile_size = tile_size
+        self.padding = padding
+        # Screen area the board is drawn in; boards bigger than it are scrolled
+        self.viewport = pygame.Rect(viewport or (0, GAME_BOARD_OFFSET_Y, SCREEN_WIDTH, SCREEN_HEIGHT - GAME_BOARD_OFFSET_Y))
+        self.scroll = [0, 0]
+        super().__init__(theme_pieces, rows, cols, seed)
+        self._build_tile_atlas(self._load_all_tile_images())
+        self._static_layer = self._build_static_layer()
+        self.invalidate()
 
     def _load_all_tile_images(self):
+        # Images come from the process-wide cache, so a new Board (restart, theme switch) rarely touches the disk
         loaded_images = {}
         # Load regular theme images
         for piece in self.theme_pieces:
             try:
                 image_path = f"{piece}.png"
-                img = pygame.image.load(image_path).convert_alpha()
-                loaded_images[piece] = pygame.transform.scale(img, (self.tile_size, self.tile_size))
+                loaded_images[piece] = image_cache.get(image_path, self.tile_size)
             except pygame.error as e:
                 print(f"Warning: Could not load regular tile image {image_path}. Error: {e}")
                 fallback_surface = pygame.Surface((self.tile_size, self.tile_size))
@@ -32,8 +38,7 @@ class Board:
         for special_type, path_base in SPECIAL_TILE_IMAGES.items():
             try:
                 image_path = f"{path_base}.png"
-                img = pygame.image.load(image_path).convert_alpha()
-                loaded_images[special_type] = pygame.transform.scale(img, (self.tile_size, self.tile_size))
+                loaded_images[special_type] = image_cache.get(image_path, self.tile_size)
             except pygame.error as e:
                 print(f"Warning: Could not load special tile image {image_path}. Error: {e}")
                 fallback_surface = pygame.Surface((self.tile_size, self.tile_size))
@@ -41,254 +46,151 @@ class Board:
                 loaded_images[special_type] = fallback_surface
         return loaded_images
 
-    def _create_initial_grid(self):
-        while True:
-            grid = [[random.choice(self.theme_pieces) for _ in range(self.grid_size)] for _ in range(self.grid_size)]
-            if not self.check_match(grid, initial_check=True)[0]:  # Check if any matches exist
-                return grid
-
-    def get_piece(self, row, col):
-        if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
-            return self.grid[row][col]
+    def _build_tile_atlas(self, loaded_images):
+        """
+        Packs every tile image into one surface, laid out in a row, plus a magenta error tile
+        at the end for pieces without an image. self.images keeps piece -> image access as
+        subsurfaces of the atlas, and self._atlas_area_by_code maps cell codes to atlas areas.
+        """
+        pieces = list(loaded_images)
+        self._tile_atlas = pygame.Surface((self.tile_size * (len(pieces) + 1), self.tile_size),
+                                          pygame.SRCALPHA).convert_alpha()
+        self._tile_atlas.fill((0, 0, 0, 0))
+        self.images = {}
+        area_by_piece = {}
+        for i, piece in enumerate(pieces):
+            area = pygame.Rect(i * self.tile_size, 0, self.tile_size, self.tile_size)
+            # BLEND_RGBA_MAX onto the transparent atlas copies the pixels exactly, alpha included
+            self._tile_atlas.blit(loaded_images[piece], area, special_flags=pygame.BLEND_RGBA_MAX)
+            area_by_piece[piece] = area
+            self.images[piece] = self._tile_atlas.subsurface(area)
+
+        # Fallback for unknown piece types (shouldn't happen with proper loading), made once
+        self._error_tile_area = pygame.Rect(len(pieces) * self.tile_size, 0, self.tile_size, self.tile_size)
+        self._tile_atlas.fill((255, 0, 255), self._error_tile_area)  # Magenta for error
+
+        self._atlas_area_by_code = [area_by_piece.get(piece, self._error_tile_area) if piece is not None else None
+                                    for piece in self._piece_by_code]
+
+    def _build_static_layer(self):
+        # Background and cell borders never change, so they are baked once and blitted per cell
+        pitch = self.tile_size + self.padding
+        layer = pygame.Surface((self.cols * pitch, self.rows * pitch)).convert()
+        layer.fill(MUTED_BLUE)
+        for row in range(self.rows):
+            for col in range(self.cols):
+                pygame.draw.rect(layer, BORDER_COLOR, (col * pitch, row * pitch, self.tile_size, self.tile_size), 1)
+        return layer
+
+    def invalidate(self):
+        """Forgets what is on screen so the next draw() repaints the whole board."""
+        self._drawn_cells = None
+        self._drawn_selected_tile = None
+        self._drawn_hint = ()
+
+    # --- Geometry. "Board space" is pixels from the board's top-left corner; the viewport is the
+    # screen rect the board is shown in, scrolled by self.scroll when the board is bigger than it. ---
+    @property
+    def content_size(self):
+        pitch = self.tile_size + self.padding
+        return self.cols * pitch - self.padding, self.rows * pitch - self.padding
+
+    @property
+    def screen_offset(self):
+        """Add to a board-space position to get its screen position."""
+        return self.viewport.x - self.scroll[0], self.viewport.y - self.scroll[1]
+
+    def cell_position(self, row, col):
+        """Top-left of a cell in board space."""
+        pitch = self.tile_size + self.padding
+        return col * pitch, row * pitch
+
+    def cell_slot_rect(self, row, col):
+        # The cell plus the padding to its right/bottom, so repainting slots also clears the gaps
+        x, y = self.cell_position(row, col)
+        offset_x, offset_y = self.screen_offset
+        return pygame.Rect(x + offset_x, y + offset_y, self.tile_size + self.padding, self.tile_size + self.padding)
+
+    def cells_in_rect(self, rect):
+        """Set of (row, col) whose slots overlap a screen rect."""
+        pitch = self.tile_size + self.padding
+        offset_x, offset_y = self.screen_offset
+        first_col = max(0, (rect.left - offset_x) // pitch)
+        last_col = min(self.cols - 1, (rect.right - 1 - offset_x) // pitch)
+        first_row = max(0, (rect.top - offset_y) // pitch)
+        last_row = min(self.rows - 1, (rect.bottom - 1 - offset_y) // pitch)
+        return {(row, col) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)}
+
+    def cell_at(self, screen_pos):
+        """The (row, col) under a screen position, or None outside the visible board."""
+        if not self.viewport.collidepoint(screen_pos):
+            return None
+        pitch = self.tile_size + self.padding
+        offset_x, offset_y = self.screen_offset
+        row, col = (screen_pos[1] - offset_y) // pitch, (screen_pos[0] - offset_x) // pitch
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
         return None
 
-    def set_piece(self, row, col, piece_type):
-        if 0 <= row < self.grid_size and 0 <= col < self.grid_size:
-            self.grid[row][col] = piece_type
-
-    def draw(self, screen, selected_tile=None):
-        for row in range(self.grid_size):
-            for col in range(self.grid_size):
-                x = col * (self.tile_size + self.padding)
-                y = row * (self.tile_size + self.padding) + GAME_BOARD_OFFSET_Y
-                if selected_tile == (row, col):
-                    pygame.draw.rect(screen, SELECTED_COLOR, (x, y, self.tile_size, self.tile_size))
-                pygame.draw.rect(screen, BORDER_COLOR, (x, y, self.tile_size, self.tile_size), 1)
-
-                piece = self.grid[row][col]
-                if piece is not None and piece in self.images:  # Ensure piece exists in loaded images
-                    screen.blit(self.images[piece], (x, y))
-                elif piece is not None:
-                    # Fallback for unknown piece types (shouldn't happen with proper loading)
-                    fallback_surface = pygame.Surface((self.tile_size, self.tile_size))
-                    fallback_surface.fill((255, 0, 255))  # Magenta for error
-                    screen.blit(fallback_surface, (x, y))
-
-    def check_match(self, current_grid=None, initial_check=False):
-        grid_to_check = current_grid if current_grid is not None else self.grid
-
-        matches = set()  # Store all (r, c) of matched tiles
-        special_creation_info = []  # List of (pos, type) for special tiles to create
-
-        # Store all detected patterns to prioritize special tile creation
-        horiz_4s = []
-        vert_4s = []
-        horiz_5s = []
-        vert_5s = []
-        # l_t_shapes = [] # Not implemented in current check_match for creation
-
-        # Check rows for 3-in-a-row and more
-        for r in range(self.grid_size):
-            for c in range(self.grid_size - 2):
-                # Only regular tiles can start a new special tile creation.
-                # Special tiles themselves do not form new specials by matching with regular ones.
-                if grid_to_check[r][c] is None or grid_to_check[r][c] in ALL_SPECIAL_TILE_TYPES:
-                    continue
-
-                if (grid_to_check[r][c] == grid_to_check[r][c + 1] == grid_to_check[r][c + 2]):
-
-                    match_coords = {(r, c), (r, c + 1), (r, c + 2)}
-
-                    # Check for 4-in-a-row horizontal
-                    if c + 3 < self.grid_size and grid_to_check[r][c] == grid_to_check[r][c + 3]:
-                        match_coords.add((r, c + 3))
-                        horiz_4s.append(list(match_coords))
-
-                        # Check for 5-in-a-row horizontal
-                        if c + 4 < self.grid_size and grid_to_check[r][c] == grid_to_check[r][c + 4]:
-                            match_coords.add((r, c + 4))
-                            horiz_5s.append(list(match_coords))
-
-                    matches.update(match_coords)  # Add all found 3+ match coords
-
-        # Check columns for 3-in-a-row and more
-        for c in range(self.grid_size):
-            for r in range(self.grid_size - 2):
-                if grid_to_check[r][c] is None or grid_to_check[r][c] in ALL_SPECIAL_TILE_TYPES:
-                    continue
-
-                if (grid_to_check[r][c] == grid_to_check[r + 1][c] == grid_to_check[r + 2][c]):
-
-                    match_coords = {(r, c), (r + 1, c), (r + 2, c)}
-
-                    # Check for 4-in-a-row vertical
-                    if r + 3 < self.grid_size and grid_to_check[r][c] == grid_to_check[r + 3][c]:
-                        match_coords.add((r + 3, c))
-                        vert_4s.append(list(match_coords))
-
-                        # Check for 5-in-a-row vertical
-                        if r + 4 < self.grid_size and grid_to_check[r][c] == grid_to_check[r + 4][c]:
-                            match_coords.add((r + 4, c))
-                            vert_5s.append(list(match_coords))
-
-                    matches.update(match_coords)  # Add all found 3+ match coords
-
-        # Prioritize special tile creation: 5-in-a-row (Color Bomb) > 4-in-a-row (Line Clear)
-        # For simplicity, if multiple possible creations, pick the first one found.
-        # This will create ONE special tile per match pattern detected.
-
-        if not initial_check:  # Only create special tiles if it's not the initial grid check
-            if horiz_5s:
-                # The position to create the special tile. Here, picking the center of the 5.
-                creation_pos = horiz_5s[0][2]
-                special_creation_info = (creation_pos, SPECIAL_COLOR_BOMB_TILE)
-            elif vert_5s:
-                creation_pos = vert_5s[0][2]
-                special_creation_info = (creation_pos, SPECIAL_COLOR_BOMB_TILE)
-            elif horiz_4s:
-                # Pick a logical spot, e.g., the 2nd tile in the 4-match (0-indexed)
-                creation_pos = horiz_4s[0][1]
-                special_creation_info = (creation_pos, SPECIAL_H_LINE_TILE)
-            elif vert_4s:
-                creation_pos = vert_4s[0][1]
-                special_creation_info = (creation_pos, SPECIAL_V_LINE_TILE)
-            # L/T shape detection and creation for SPECIAL_BOMB_TILE would go here.
-            # Example (simplified): if (r,c) is part of a 3-horiz and a 3-vert, create bomb.
-            # This requires more complex pattern matching.
-            # For now, it will only create color bombs or line clears.
-            else:
-                special_creation_info = (None, None)  # No special tile to create
-        else:
-            special_creation_info = (None, None)  # No special tile creation on initial grid check
-
-        return list(matches), special_creation_info
-
-    def remove_tiles(self, tiles_to_remove_set):
-        for r, c in tiles_to_remove_set:
-            self.grid[r][c] = None
-
-    def drop_pieces(self):
-        for col in range(self.grid_size):
-            for row in range(self.grid_size - 1, -1, -1):
-                if self.grid[row][col] is None:
-                    for above_row in range(row - 1, -1, -1):
-                        if self.grid[above_row][col] is not None:
-                            self.grid[row][col] = self.grid[above_row][col]
-                            self.grid[above_row][col] = None
-                            break
-
-    def refill_grid(self):
-        for row in range(self.grid_size):
-            for col in range(self.grid_size):
-                if self.grid[row][col] is None:
-                    self.grid[row][col] = random.choice(self.theme_pieces)  # Only regular pieces for refilling
-
-    def swap_tiles(self, pos1, pos2):
-        self.grid[pos1[0]][pos1[1]], self.grid[pos2[0]][pos2[1]] = \
-            self.grid[pos2[0]][pos2[1]], self.grid[pos1[0]][pos1[1]]
-
-    def valid_swap_positions(self, pos1, pos2):
-        return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1]) == 1
-
-    def has_valid_moves(self):
-        temp_grid = copy.deepcopy(self.grid)
-
-        for r in range(self.grid_size):
-            for c in range(self.grid_size):
-                # Try swapping right
-                if c + 1 < self.grid_size:
-                    temp_grid[r][c], temp_grid[r][c + 1] = temp_grid[r][c + 1], temp_grid[r][c]
-                    if self.check_match(temp_grid, initial_check=True)[0]:  # Check if any matches are formed
-                        return True
-                    temp_grid[r][c], temp_grid[r][c + 1] = temp_grid[r][c + 1], temp_grid[r][c]  # Swap back
-
-                # Try swapping down
-                if r + 1 < self.grid_size:
-                    temp_grid[r][c], temp_grid[r + 1][c] = temp_grid[r + 1][c], temp_grid[r][c]
-                    if self.check_match(temp_grid, initial_check=True)[0]:  # Check if any matches are formed
-                        return True
-                    temp_grid[r][c], temp_grid[r + 1][c] = temp_grid[r + 1][c], temp_grid[r][c]  # Swap back
-        return False
-
-    def reshuffle_board(self):
-        print("No valid moves found, reshuffling board!")
-        # Store all existing pieces (excluding Nones)
-        existing_pieces = [self.grid[r][c] for r in range(self.grid_size) for c in range(self.grid_size) if
-                           self.grid[r][c] is not None]
-
-        # Add enough new random regular pieces to fill the grid if existing aren't enough
-        num_missing = self.grid_size * self.grid_size - len(existing_pieces)
-        existing_pieces.extend([random.choice(self.theme_pieces) for _ in range(num_missing)])
-
-        random.shuffle(existing_pieces)
-
-        # Ensure the reshuffled board has no initial matches
-        while True:
-            temp_grid_flat_idx = 0
-            new_grid = [[None for _ in range(self.grid_size)] for _ in range(self.grid_size)]
-
-            # Populate new_grid from shuffled existing_pieces
-            for r in range(self.grid_size):
-                for c in range(self.grid_size):
-                    if temp_grid_flat_idx < len(existing_pieces):
-                        new_grid[r][c] = existing_pieces[temp_grid_flat_idx]
-                        temp_grid_flat_idx += 1
-                    else:
-                        new_grid[r][c] = random.choice(self.theme_pieces)  # Fallback if not enough pieces
-
-            if not self.check_match(new_grid, initial_check=True)[0]:  # Ensure no matches on reshuffle
-                self.grid = new_grid
-                break
-            random.shuffle(existing_pieces)  # Shuffle again if a match was found
-
-    def get_tiles_to_clear_from_special(self, r, c, target_piece_type=None):
+    def scroll_by(self, dx, dy):
+        """Scrolls the view of a board larger than its viewport. Returns True if the view moved."""
+        content_width, content_height = self.content_size
+        new_scroll = [min(max(0, self.scroll[0] + dx), max(0, content_width - self.viewport.width)),
+                      min(max(0, self.scroll[1] + dy), max(0, content_height - self.viewport.height))]
+        if new_scroll == self.scroll:
+            return False
+        self.scroll = new_scroll
+        self.invalidate()
+        return True
+
+    def draw(self, screen, selected_tile=None, cells=None, extra_dirty_cells=(), hint=None):
         """
-        Calculates which tiles are affected by a special tile's activation.
-        Returns a set of (row, col) coordinates to be cleared.
-        This method itself does NOT recursively activate other specials it clears,
-        that's handled in the Game._handle_tile_swap cascade loop.
+        Repaints only the visible cells that changed since the previous call (plus extra_dirty_cells,
+        e.g. cells a moving tile passed over) and returns the list of updated screen rects.
+        cells lets callers draw a snapshot (e.g. a cascade step being animated) instead of the live board.
+        hint is a Move (see ranked_moves) whose two cells get outlined.
         """
-        tiles_to_clear_this_activation = set()
-        tile_type = self.get_piece(r, c)  # Get the type of the special tile itself
-
-        if tile_type is None or tile_type not in ALL_SPECIAL_TILE_TYPES:
-            return tiles_to_clear_this_activation  # Not a special tile or already cleared
-
-        # Add the special tile itself to be cleared
-        tiles_to_clear_this_activation.add((r, c))
-
-        if tile_type == SPECIAL_H_LINE_TILE:
-            for col_idx in range(self.grid_size):
-                tiles_to_clear_this_activation.add((r, col_idx))
-        elif tile_type == SPECIAL_V_LINE_TILE:
-            for row_idx in range(self.grid_size):
-                tiles_to_clear_this_activation.add((row_idx, c))
-        elif tile_type == SPECIAL_BOMB_TILE:
-            for row_offset in range(-1, 2):
-                for col_offset in range(-1, 2):
-                    clear_r, clear_c = r + row_offset, c + col_offset
-                    if 0 <= clear_r < self.grid_size and 0 <= clear_c < self.grid_size:
-                        tiles_to_clear_this_activation.add((clear_r, clear_c))
-        elif tile_type == SPECIAL_COLOR_BOMB_TILE:
-            color_to_clear = target_piece_type
-
-            # If no target provided (e.g., activated by cascade), or target is also a special tile,
-            # then randomly pick a regular piece type from the current board.
-            if color_to_clear is None or color_to_clear in ALL_SPECIAL_TILE_TYPES:
-                available_regular_pieces_on_board = list(set([self.get_piece(r_idx, c_idx)
-                                                              for r_idx in range(self.grid_size)
-                                                              for c_idx in range(self.grid_size)
-                                                              if self.get_piece(r_idx, c_idx) in self.theme_pieces]))
-                if available_regular_pieces_on_board:
-                    color_to_clear = random.choice(available_regular_pieces_on_board)
-                else:  # No regular pieces left on board, nothing to clear by color
-                    color_to_clear = None
-
-            if color_to_clear:
-                for row_idx in range(self.grid_size):
-                    for col_idx in range(self.grid_size):
-                        if self.get_piece(row_idx, col_idx) == color_to_clear:
-                            tiles_to_clear_this_activation.add((row_idx, col_idx))
-            # If no color to clear (e.g., board empty of regular tiles), it just clears itself (already added)
-
-        return tiles_to_clear_this_activation
\ No newline at end of file
+        hint_cells = (hint.pos1, hint.pos2) if hint is not None else ()
+        cells = self.cells if cells is None else cells
+        visible_cells = self.cells_in_rect(self.viewport)
+        if self._drawn_cells is None:
+            dirty_cells = set(visible_cells)
+        else:
+            dirty_cells = {(int(row), int(col)) for row, col in np.argwhere(cells != self._drawn_cells)}
+            if selected_tile != self._drawn_selected_tile:
+                dirty_cells.update(tile for tile in (selected_tile, self._drawn_selected_tile) if tile is not None)
+            if hint_cells != self._drawn_hint:
+                dirty_cells.update(hint_cells + self._drawn_hint)
+            dirty_cells.update(extra_dirty_cells)
+            dirty_cells &= visible_cells
+        self._drawn_cells = cells.copy()
+        self._drawn_selected_tile = selected_tile
+        self._drawn_hint = hint_cells
+
+        offset = self.screen_offset
+        background_blits = []
+        tile_blits = []
+        dirty_rects = []
+        for row, col in dirty_cells:
+            slot = self.cell_slot_rect(row, col)
+            dirty_rects.append(slot.clip(self.viewport))
+            background_blits.append((self._static_layer, slot, slot.move(-offset[0], -offset[1])))
+            code = cells[row, col]
+            if code:
+                area = self._atlas_area_by_code[code] if code < len(self._atlas_area_by_code) else None
+                tile_blits.append((self._tile_atlas, slot.topleft, area or self._error_tile_area))
+
+        # Cells at the viewport edge are only partly visible
+        screen.set_clip(self.viewport)
+        screen.blits(background_blits, doreturn=False)
+        if selected_tile in dirty_cells:
+            x, y = self.cell_slot_rect(*selected_tile).topleft
+            pygame.draw.rect(screen, SELECTED_COLOR, (x, y, self.tile_size, self.tile_size))
+            pygame.draw.rect(screen, BORDER_COLOR, (x, y, self.tile_size, self.tile_size), 1)
+        screen.blits(tile_blits, doreturn=False)
+        for cell in hint_cells:
+            if cell in dirty_cells:
+                x, y = self.cell_slot_rect(*cell).topleft
+                pygame.draw.rect(screen, HINT_COLOR, (x, y, self.tile_size, self.tile_size), 3)
+        screen.set_clip(None)
+        return dirty_rects
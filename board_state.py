@@ -0,0 +1,721 @@
+import random
+from collections import Counter
+import numpy as np
+from bitboard import Bitboards
+from profiler import profiler
+from constants import *
+
+# Integer codes stored in Board.cells. Regular pieces use 1..SPECIAL_CODE_BASE - 1 (in theme order),
+# special tiles use SPECIAL_CODE_BASE + their index in ALL_SPECIAL_TILE_TYPES.
+EMPTY_CODE = 0
+SPECIAL_CODE_BASE = 64
+SPECIAL_CODES = {special_type: SPECIAL_CODE_BASE + i for i, special_type in enumerate(ALL_SPECIAL_TILE_TYPES)}
+CELL_DTYPE = np.int8
+# How each special tile combines when two are swapped together (see get_tiles_to_clear_from_combo)
+_COMBO_KIND = {SPECIAL_H_LINE_TILE: "line", SPECIAL_V_LINE_TILE: "line", SPECIAL_BOMB_TILE: "bomb",
+               SPECIAL_COLOR_BOMB_TILE: "color"}
+
+
+class DropResult:
+    """
+    What drop_pieces did. moves: (col, from_row, to_row) per moved tile; fall_distances[col]:
+    how many cells the column dropped, i.e. how many new pieces refill_grid will add on top.
+    """
+
+    def __init__(self, moves, fall_distances, changed_cells):
+        self.moves = moves
+        self.fall_distances = fall_distances
+        self.changed_cells = changed_cells
+
+
+class Move:
+    """
+    A valid swap and what it does right away: how many tiles it clears, the special tiles it
+    creates and the points for the clear. Cascades are not included, they depend on refills.
+    """
+
+    def __init__(self, pos1, pos2, cleared, specials, score):
+        self.pos1 = pos1
+        self.pos2 = pos2
+        self.cleared = cleared
+        self.specials = specials  # Special tile types, one per group of connected runs
+        self.score = score
+
+
+class BoardState:
+    """
+    The rules side of the board: piece codes, matching, gravity, refills and specials.
+    Does not import pygame, so it can be used headless (see engine.py).
+    """
+
+    def __init__(self, theme_pieces, rows=GRID_SIZE, cols=None, seed=None):
+        # Every random choice the board makes comes from its own RNG, so a seed reproduces a whole game
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        # Boards may be non-square; cols defaults to rows
+        self.rows = rows
+        self.cols = rows if cols is None else cols
+        self.theme_pieces = theme_pieces  # Regular pieces
+        self.all_possible_pieces = list(theme_pieces)  # Used for refilling
+
+        # Lookup tables between piece names and cell codes
+        self._piece_by_code = [None] * (SPECIAL_CODE_BASE + len(ALL_SPECIAL_TILE_TYPES))
+        self._code_by_piece = {}
+        for i, piece in enumerate(theme_pieces):
+            self._code_by_piece[piece] = i + 1
+            self._piece_by_code[i + 1] = piece
+        for special_type, code in SPECIAL_CODES.items():
+            self._code_by_piece[special_type] = code
+            self._piece_by_code[code] = special_type
+        self.theme_codes = [self._code_by_piece[piece] for piece in theme_pieces]
+
+        self.cells = self._create_initial_grid()
+        # Cells of each piece code on the board, kept up to date by every mutating method, so color
+        # clears and piece counts cost as much as the tiles involved rather than a board scan,
+        # and the same as one bitboard per regular piece code for matching (see bitboard.py)
+        self._positions = {}
+        self._bitboards = Bitboards(self.rows, self.cols, SPECIAL_CODE_BASE)
+        self._bitboards_stale = False  # Repacked from self.cells on next use (see _current_bitboards)
+        self._rebuild_piece_index()
+
+        # Swaps that produce a match, as bitboard masks: bit (r, c) of _h_moves is the swap
+        # (r, c)-(r, c + 1), of _v_moves the swap (r, c)-(r + 1, c). Mutating methods only mark
+        # the cells they touched; the masks are recomputed on demand.
+        self._h_moves = self._v_moves = 0
+        self._valid_move_count = 0
+        self._move_index_dirty_cells = set()
+        # Evaluated moves, (pos1, pos2) -> Move, dropped around changed cells like the masks,
+        # and the ranked list built from them (None once the board changed)
+        self._move_cache = {}
+        self._ranked_moves = None
+        self._rebuild_move_index()
+
+    @property
+    def grid(self):
+        """The board as a list of rows of piece names (None for empty). Decoded from self.cells."""
+        return [[self._piece_by_code[code] for code in row] for row in self.cells.tolist()]
+
+    @grid.setter
+    def grid(self, new_grid):
+        self.cells = self._encode_grid(new_grid)
+        self._rebuild_piece_index()
+        self._rebuild_move_index()
+
+    def encode_piece(self, piece_type):
+        if piece_type is None:
+            return EMPTY_CODE
+        code = self._code_by_piece.get(piece_type)
+        if code is None:
+            # Unknown regular piece (not part of the theme): give it the next free regular code
+            code = len(self._code_by_piece) - len(SPECIAL_CODES) + 1
+            if code >= SPECIAL_CODE_BASE:
+                raise ValueError(f"Too many piece types, cannot encode {piece_type}")
+            self._code_by_piece[piece_type] = code
+            self._piece_by_code[code] = piece_type
+        return code
+
+    def decode_piece(self, code):
+        return self._piece_by_code[code]
+
+    def _encode_grid(self, grid):
+        if isinstance(grid, np.ndarray):
+            return grid.astype(CELL_DTYPE, copy=False)
+        return np.array([[self.encode_piece(piece) for piece in row] for row in grid], dtype=CELL_DTYPE)
+
+    def _create_initial_grid(self):
+        return self._generate_cells()
+
+    def _generate_cells(self, codes=None):
+        """
+        Builds a board cell by cell that has no 3-runs and at least one valid move, without
+        retrying whole boards. With codes (a list of cell codes) the board uses exactly that
+        multiset of pieces, which is how reshuffle_board keeps the tiles (and specials) on the board.
+        """
+        remaining = None if codes is None else Counter(codes)
+        for _ in range(BOARD_GENERATION_ATTEMPTS):
+            cells = self._fill_without_runs(Counter(remaining) if remaining is not None else None)
+            if cells is not None:
+                return np.array(cells, dtype=CELL_DTYPE)
+        # The multiset can't be placed without a run (e.g. almost all one colour): fall back to a fresh board
+        return np.array(self._fill_without_runs(None), dtype=CELL_DTYPE)
+
+    def _fill_without_runs(self, remaining):
+        """
+        One constructive attempt. remaining is a Counter of codes to place, or None to draw
+        freely from the theme. Returns a list of rows of codes, or None on a dead end.
+        """
+        rows, cols = self.rows, self.cols
+        cells = [[EMPTY_CODE] * cols for _ in range(rows)]
+
+        # Plant one guaranteed move first: X X . / . . X (or its vertical/mirrored forms),
+        # where swapping the lone X up (or down) next to the pair completes a run.
+        forms = []
+        if rows >= 2 and cols >= 3:
+            forms.append("horizontal")
+        if rows >= 3 and cols >= 2:
+            forms.append("vertical")
+        if forms:
+            if remaining is None:
+                move_code = self.rng.choice(self.theme_codes)
+            else:
+                candidates = [code for code, count in remaining.items() if _is_regular(code) and count >= 3]
+                move_code = self.rng.choice(candidates) if candidates else None
+            if move_code is not None:
+                side = self.rng.choice((-1, 1))
+                if self.rng.choice(forms) == "horizontal":
+                    r, c = self.rng.randrange(rows - 1) + (side < 0), self.rng.randrange(cols - 2)
+                    seed_cells = [(r, c), (r, c + 1), (r + side, c + 2)]
+                else:
+                    r, c = self.rng.randrange(rows - 2), self.rng.randrange(cols - 1) + (side < 0)
+                    seed_cells = [(r, c), (r + 1, c), (r + 2, c + side)]
+                for row, col in seed_cells:
+                    cells[row][col] = move_code
+                if remaining is not None:
+                    remaining[move_code] -= 3
+
+        for row in range(rows):
+            for col in range(cols):
+                if cells[row][col] != EMPTY_CODE:
+                    continue
+                if remaining is None:
+                    allowed = [code for code in self.theme_codes if not _makes_run(cells, row, col, code)]
+                    if not allowed:
+                        return None
+                    cells[row][col] = self.rng.choice(allowed)
+                else:
+                    allowed = [code for code, count in remaining.items()
+                               if count > 0 and not _makes_run(cells, row, col, code)]
+                    if not allowed:
+                        return None
+                    # Weighting by how many are left keeps the common pieces from piling up at the end
+                    code = self.rng.choices(allowed, weights=[remaining[code] for code in allowed])[0]
+                    cells[row][col] = code
+                    remaining[code] -= 1
+        return cells
+
+    def get_piece(self, row, col):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return self._piece_by_code[self.cells[row, col]]
+        return None
+
+    def set_piece(self, row, col, piece_type):
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            code = self.encode_piece(piece_type)
+            self._move_piece_index(int(self.cells[row, col]), code, (row, col))
+            self.cells[row, col] = code
+            self._move_index_dirty_cells.add((row, col))
+
+    def check_match(self, current_grid=None, initial_check=False, dirty_cells=None):
+        """
+        Scans the grid for 3+ runs. Returns (list of matched (r, c), list of (pos, special_type, shape)
+        for the special tiles the matches create, one per group of connected runs).
+        current_grid may be a code array or a list of rows of piece names; defaults to self.cells.
+        If dirty_cells is given, only runs in the rows and columns passing through those cells
+        count. On a board that had no matches before those cells changed this gives the same
+        result as a full scan.
+        The board's own cells are matched on its bitboards; other grids are scanned with numpy.
+        """
+        profiler.count("check_match")
+        if current_grid is None:
+            return self._check_match_bitboards(initial_check, dirty_cells)
+        cells = self._encode_grid(current_grid)
+
+        if dirty_cells is None:
+            rows_to_check = np.arange(self.rows)
+            cols_to_check = np.arange(self.cols)
+        else:
+            # Sorted so patterns are found in the same order as a full scan
+            rows_to_check = np.array(sorted({r for r, _ in dirty_cells}), dtype=np.intp)
+            cols_to_check = np.array(sorted({c for _, c in dirty_cells}), dtype=np.intp)
+
+        matched = np.zeros(cells.shape, dtype=bool)
+
+        # Rows: horiz_runs[k][i, c] is True if a k-run starts at (rows_to_check[i], c)
+        horiz_runs = _run_starts(cells[rows_to_check, :])
+        for offset in range(3):
+            matched[rows_to_check[:, None], np.arange(offset, offset + horiz_runs[3].shape[1])] |= horiz_runs[3]
+
+        # Columns, scanned on the transposed grid so the same helper applies
+        vert_runs = _run_starts(cells[:, cols_to_check].T)
+        for offset in range(3):
+            matched[np.arange(offset, offset + vert_runs[3].shape[1])[:, None], cols_to_check] |= vert_runs[3].T
+
+        matches = [(int(r), int(c)) for r, c in np.argwhere(matched)]
+
+        # One special tile per group of connected runs (see _component_specials).
+        # No special tile creation on initial grid check.
+        specials = []
+        if not initial_check and matches:
+            horiz_starts = [(int(rows_to_check[i]), j) for i, j in np.argwhere(horiz_runs[3]).tolist()]
+            vert_starts = [(int(cols_to_check[i]), j) for i, j in np.argwhere(vert_runs[3]).tolist()]
+            specials = _component_specials(_segments_from_starts(horiz_starts, True) +
+                                           _segments_from_starts(vert_starts, False))
+
+        return matches, specials
+
+    def _check_match_bitboards(self, initial_check, dirty_cells):
+        bitboards = self._current_bitboards()
+        h_starts, v_starts = bitboards.run_starts()
+        if dirty_cells is not None:
+            h_starts &= bitboards.line_mask(rows={r for r, _ in dirty_cells})
+            v_starts &= bitboards.line_mask(cols={c for _, c in dirty_cells})
+        matches = bitboards.cells(bitboards.run_cells(h_starts, v_starts))
+
+        specials = []
+        if not initial_check and matches:
+            # Vertical runs are listed column by column, like the transposed scan in check_match
+            vert_starts = sorted((c, r) for r, c in bitboards.cells(v_starts))
+            specials = _component_specials(_segments_from_starts(bitboards.cells(h_starts), True) +
+                                           _segments_from_starts(vert_starts, False))
+        return matches, specials
+
+    def remove_tiles(self, tiles_to_remove_set):
+        if not tiles_to_remove_set:
+            return
+        rows, cols = zip(*tiles_to_remove_set)
+        for code, cell in zip(self.cells[list(rows), list(cols)].tolist(), zip(rows, cols)):
+            self._move_piece_index(code, EMPTY_CODE, cell)
+        self.cells[list(rows), list(cols)] = EMPTY_CODE
+        self._move_index_dirty_cells.update(tiles_to_remove_set)
+
+    def drop_pieces(self):
+        """
+        Moves pieces down into empty cells in one pass over each column and returns a DropResult
+        with every moved tile's source/destination row, each column's fall distance and the
+        cells whose content changed.
+        """
+        # Each piece falls by the number of empty cells below it in its column
+        empty = self.cells == EMPTY_CODE
+        empty_below = np.cumsum(empty[::-1], axis=0)[::-1] - empty
+        rows, cols = np.nonzero(~empty)
+        dest_rows = rows + empty_below[rows, cols]
+
+        dropped = np.full_like(self.cells, EMPTY_CODE)
+        dropped[dest_rows, cols] = self.cells[rows, cols]
+
+        moved = dest_rows != rows
+        moves = list(zip(cols[moved].tolist(), rows[moved].tolist(), dest_rows[moved].tolist()))
+        # All sources first: a piece may land where another of the same kind just left
+        moved_codes = self.cells[rows[moved], cols[moved]].tolist()
+        for code, (col, from_row, _) in zip(moved_codes, moves):
+            self._positions[code].discard((from_row, col))
+        for code, (col, _, to_row) in zip(moved_codes, moves):
+            self._positions[code].add((to_row, col))
+        changed_cells = set(map(tuple, np.argwhere(dropped != self.cells).tolist()))
+        self.cells = dropped
+        # Most of the board may have moved; repacking the bitboards is cheaper than moving bits one by one
+        self._bitboards_stale = True
+        self._move_index_dirty_cells.update(changed_cells)
+        return DropResult(moves, empty.sum(axis=0).tolist(), changed_cells)
+
+    def refill_grid(self):
+        """Fills empty cells with random regular pieces. Returns the set of filled cells."""
+        empty = np.argwhere(self.cells == EMPTY_CODE)
+        if not len(empty):
+            return set()
+        # Only regular pieces for refilling
+        codes = self.rng.choices(self.theme_codes, k=len(empty))
+        self.cells[empty[:, 0], empty[:, 1]] = codes
+        filled_cells = set(map(tuple, empty.tolist()))
+        for code, cell in zip(codes, map(tuple, empty.tolist())):
+            self._positions.setdefault(code, set()).add(cell)
+        self._bitboards_stale = True
+        self._move_index_dirty_cells.update(filled_cells)
+        return filled_cells
+
+    def swap_tiles(self, pos1, pos2):
+        (r1, c1), (r2, c2) = pos1, pos2
+        code1, code2 = int(self.cells[r1, c1]), int(self.cells[r2, c2])
+        if code1 != code2:
+            self._move_piece_index(code1, code2, (r1, c1))
+            self._move_piece_index(code2, code1, (r2, c2))
+        self.cells[r1, c1], self.cells[r2, c2] = code2, code1
+        self._move_index_dirty_cells.add((r1, c1))
+        self._move_index_dirty_cells.add((r2, c2))
+
+    def valid_swap_positions(self, pos1, pos2):
+        return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1]) == 1
+
+    def has_valid_moves(self):
+        """
+        Returns True if at least one swap on the current board produces a match.
+        Answered from the move index that also backs valid_moves() and ranked_moves(): free when
+        nothing changed since the last query, a few bitboard operations per piece code otherwise.
+        """
+        self._refresh_move_index()
+        return self._valid_move_count > 0
+
+    def valid_moves(self):
+        """All swaps ((r1, c1), (r2, c2)) on the current board that produce a match, row-major."""
+        self._refresh_move_index()
+        moves = [((r, c), (r, c + 1)) for r, c in self._bitboards.cells(self._h_moves)]
+        moves += [((r, c), (r + 1, c)) for r, c in self._bitboards.cells(self._v_moves)]
+        return sorted(moves)
+
+    def special_swaps(self):
+        """Swaps that move a special tile, row-major. These are always valid: the special fires."""
+        bitboards = self._current_bitboards()
+        h, v = bitboards.special_swap_masks()
+        swaps = [((r, c), (r, c + 1)) for r, c in bitboards.cells(h)]
+        swaps += [((r, c), (r + 1, c)) for r, c in bitboards.cells(v)]
+        return sorted(swaps)
+
+    def ranked_moves(self):
+        """
+        Every valid swap as a Move, best first (highest score, then the most special tiles created).
+        Cached until the board changes; afterwards only swaps near the changed cells are re-evaluated.
+        """
+        self._refresh_move_index()
+        if self._ranked_moves is None:
+            moves = []
+            for pos1, pos2 in self.valid_moves():
+                move = self._move_cache.get((pos1, pos2))
+                if move is None:
+                    move = self._move_cache[(pos1, pos2)] = self._evaluate_move(pos1, pos2)
+                moves.append(move)
+            moves.sort(key=lambda move: (-move.score, -len(move.specials), move.pos1, move.pos2))
+            self._ranked_moves = moves
+        return list(self._ranked_moves)
+
+    def best_move(self):
+        """The top ranked Move, or None if there is no valid swap."""
+        moves = self.ranked_moves()
+        return moves[0] if moves else None
+
+    def _evaluate_move(self, pos1, pos2):
+        # On a settled board a swap can only form runs in the rows/columns through the swapped
+        # cells and within two cells of them, so it is played out on a small window. Same result
+        # as swapping and calling check_match(dirty_cells={pos1, pos2}), minus the numpy overhead.
+        r0, c0 = max(0, min(pos1[0], pos2[0]) - 2), max(0, min(pos1[1], pos2[1]) - 2)
+        window = self.cells[r0:max(pos1[0], pos2[0]) + 3, c0:max(pos1[1], pos2[1]) + 3].tolist()
+        (r1, c1), (r2, c2) = (pos1[0] - r0, pos1[1] - c0), (pos2[0] - r0, pos2[1] - c0)
+        window[r1][c1], window[r2][c2] = window[r2][c2], window[r1][c1]
+
+        matched = set()
+        segments = []
+        for horizontal in (True, False):
+            for index in sorted({r1, r2} if horizontal else {c1, c2}):
+                line = window[index] if horizontal else [row[index] for row in window]
+                for start, length in _line_runs(line):
+                    matched.update((index, i) if horizontal else (i, index) for i in range(start, start + length))
+                    segments.append([horizontal, index, start, length])
+        specials = [special_type for _, special_type, _ in _component_specials(segments)]
+        return Move(pos1, pos2, len(matched), specials, len(matched) * POINTS_PER_TILE)
+
+    def copy(self, seed=None):
+        """
+        Independent copy of the board, e.g. to try a move out without touching this one. The copy's RNG
+        continues from this board's state, or starts from seed if one is given.
+        """
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._piece_by_code = list(self._piece_by_code)
+        clone._code_by_piece = dict(self._code_by_piece)
+        clone.cells = self.cells.copy()
+        clone._move_index_dirty_cells = set(self._move_index_dirty_cells)
+        clone._move_cache = dict(self._move_cache)
+        clone._positions = {code: set(cells) for code, cells in self._positions.items()}
+        clone._bitboards = self._bitboards.copy()
+        if seed is None:
+            clone.rng = random.Random()
+            clone.rng.setstate(self.rng.getstate())
+        else:
+            clone.rng = random.Random(seed)
+        return clone
+
+    def with_cells(self, cells, seed=None):
+        """
+        A board like this one (theme, size and piece codes) holding cells, a code array or its
+        tobytes(), with its indexes rebuilt. The RNG is set up as in copy().
+        """
+        clone = self.copy(seed)
+        clone.cells = np.frombuffer(cells, dtype=CELL_DTYPE).reshape(self.rows, self.cols).copy() \
+            if isinstance(cells, bytes) else self._encode_grid(cells).copy()
+        clone._rebuild_piece_index()
+        clone._rebuild_move_index()
+        return clone
+
+    def piece_counts(self):
+        """How many of each piece are on the board, {piece: count}."""
+        return {self._piece_by_code[code]: len(cells) for code, cells in self._positions.items() if cells}
+
+    def _rebuild_piece_index(self):
+        self._positions = {int(code): set(map(tuple, np.argwhere(self.cells == code).tolist()))
+                           for code in np.unique(self.cells) if code != EMPTY_CODE}
+        self._bitboards.load(self.cells)
+        self._bitboards_stale = False
+
+    def _move_piece_index(self, old_code, new_code, cell):
+        # cell changes from old_code to new_code
+        if old_code != EMPTY_CODE:
+            self._positions[old_code].discard(cell)
+        if new_code != EMPTY_CODE:
+            self._positions.setdefault(new_code, set()).add(cell)
+        if not self._bitboards_stale:
+            self._bitboards.move(old_code, new_code, cell)
+
+    def _current_bitboards(self):
+        if self._bitboards_stale:
+            self._bitboards.load(self.cells)
+            self._bitboards_stale = False
+        return self._bitboards
+
+    def _rebuild_move_index(self):
+        self._h_moves, self._v_moves = self._current_bitboards().swap_masks()
+        self._valid_move_count = self._h_moves.bit_count() + self._v_moves.bit_count()
+        self._move_index_dirty_cells = set()
+        self._move_cache = {}
+        self._ranked_moves = None
+
+    def _refresh_move_index(self):
+        if not self._move_index_dirty_cells:
+            return
+        # The masks are cheap enough to recompute whole. Evaluated moves are kept where they can't
+        # have changed: a swap can only change its outcome if a changed cell lies within two tiles
+        # (same row or column) of one of the swapped positions, so the evaluations dropped are
+        # those in the bounding box of the changed cells grown by 3.
+        dirty_rows = [r for r, _ in self._move_index_dirty_cells]
+        dirty_cols = [c for _, c in self._move_index_dirty_cells]
+        self._move_index_dirty_cells.clear()
+        r0, r1 = min(dirty_rows) - 3, max(dirty_rows) + 4
+        c0, c1 = min(dirty_cols) - 3, max(dirty_cols) + 4
+        self._ranked_moves = None
+        for key in [key for key in self._move_cache if r0 <= key[0][0] < r1 and c0 <= key[0][1] < c1]:
+            del self._move_cache[key]
+        self._h_moves, self._v_moves = self._current_bitboards().swap_masks()
+        self._valid_move_count = self._h_moves.bit_count() + self._v_moves.bit_count()
+
+    def reshuffle_board(self):
+        """Rearranges the pieces on the board (specials included) into a layout with no runs and a valid move."""
+        # Store all existing pieces (excluding Nones)
+        existing_codes = self.cells[self.cells != EMPTY_CODE].tolist()
+
+        # Add enough new random regular pieces to fill the grid if existing aren't enough
+        num_missing = self.rows * self.cols - len(existing_codes)
+        existing_codes.extend([self.rng.choice(self.theme_codes) for _ in range(num_missing)])
+
+        self.cells = self._generate_cells(existing_codes)
+        self._rebuild_piece_index()
+        self._rebuild_move_index()
+
+    def get_tiles_to_clear_from_special(self, r, c, target_piece_type=None):
+        """
+        Calculates which tiles are affected by a special tile's activation.
+        Returns a set of (row, col) coordinates to be cleared.
+        This method itself does NOT recursively activate other specials it clears,
+        that's handled in the engine.resolve_swap cascade loop.
+        """
+        tiles_to_clear_this_activation = set()
+        tile_type = self.get_piece(r, c)  # Get the type of the special tile itself
+
+        if tile_type is None or tile_type not in SPECIAL_CODES:
+            return tiles_to_clear_this_activation  # Not a special tile or already cleared
+
+        # Add the special tile itself to be cleared
+        tiles_to_clear_this_activation.add((r, c))
+
+        if tile_type == SPECIAL_H_LINE_TILE:
+            for col_idx in range(self.cols):
+                tiles_to_clear_this_activation.add((r, col_idx))
+        elif tile_type == SPECIAL_V_LINE_TILE:
+            for row_idx in range(self.rows):
+                tiles_to_clear_this_activation.add((row_idx, c))
+        elif tile_type == SPECIAL_BOMB_TILE:
+            for row_offset in range(-1, 2):
+                for col_offset in range(-1, 2):
+                    clear_r, clear_c = r + row_offset, c + col_offset
+                    if 0 <= clear_r < self.rows and 0 <= clear_c < self.cols:
+                        tiles_to_clear_this_activation.add((clear_r, clear_c))
+        elif tile_type == SPECIAL_COLOR_BOMB_TILE:
+            color_code = self._code_by_piece.get(target_piece_type, EMPTY_CODE)
+
+            # If no target provided (e.g., activated by cascade), or target is also a special tile,
+            # then randomly pick a regular piece type from the current board.
+            if not _is_regular(color_code):
+                available_regular_codes_on_board = self._regular_codes_on_board()
+                if available_regular_codes_on_board:
+                    color_code = self.rng.choice(available_regular_codes_on_board)
+                else:  # No regular pieces left on board, nothing to clear by color
+                    color_code = EMPTY_CODE
+
+            if color_code != EMPTY_CODE:
+                tiles_to_clear_this_activation.update(self._positions.get(color_code, ()))
+            # If no color to clear (e.g., board empty of regular tiles), it just clears itself (already added)
+
+        return tiles_to_clear_this_activation
+
+    def _regular_codes_on_board(self):
+        return sorted(code for code, cells in self._positions.items() if cells and _is_regular(code))
+
+    def get_tiles_to_clear_from_combo(self, pos, special_type1, special_type2):
+        """
+        Tiles cleared when two special tiles are swapped with each other and fire together at pos:
+          line + line              the row and the column through pos
+          line + bomb              the three rows and three columns through pos
+          bomb + bomb              the 5x5 square around pos
+          color bomb + line        every tile of the most common color fires as that line
+          color bomb + bomb        every tile of the most common color explodes 3x3
+          color bomb + color bomb  the whole board
+        Worked out on whole-board masks, so a combo costs the same however many tiles it hits.
+        """
+        kinds = sorted(_COMBO_KIND[special_type] for special_type in (special_type1, special_type2))
+        r, c = pos
+        mask = np.zeros(self.cells.shape, dtype=bool)
+        if kinds == ["bomb", "bomb"]:
+            mask[max(0, r - 2):r + 3, max(0, c - 2):c + 3] = True
+        elif kinds == ["bomb", "line"]:
+            mask[max(0, r - 1):r + 2, :] = True
+            mask[:, max(0, c - 1):c + 2] = True
+        elif kinds == ["line", "line"]:
+            mask[r, :] = True
+            mask[:, c] = True
+        elif kinds == ["color", "color"]:
+            mask[:] = True
+        else:
+            # Color bomb with a line or bomb: the most common color takes on the other special's effect
+            codes = self._regular_codes_on_board()
+            color_mask = np.zeros(self.cells.shape, dtype=bool)
+            if codes:
+                # Ties go to the lowest code
+                color_cells = max((self._positions[code] for code in codes), key=len)
+                color_mask[tuple(np.array(list(color_cells)).T)] = True
+            other = special_type2 if _COMBO_KIND[special_type1] == "color" else special_type1
+            if other == SPECIAL_H_LINE_TILE:
+                mask[color_mask.any(axis=1), :] = True
+            elif other == SPECIAL_V_LINE_TILE:
+                mask[:, color_mask.any(axis=0)] = True
+            else:  # Bomb: grow the color mask by one cell in every direction
+                padded = np.pad(color_mask, 1)
+                for dr in range(3):
+                    for dc in range(3):
+                        mask |= padded[dr:dr + self.rows, dc:dc + self.cols]
+        mask[r, c] = True
+        return {(int(row), int(col)) for row, col in np.argwhere(mask)}
+
+
+def _is_regular(codes):
+    return (codes > EMPTY_CODE) & (codes < SPECIAL_CODE_BASE)
+
+
+def _makes_run(cells, row, col, code):
+    """True if placing code at (row, col) of a list-of-rows grid would complete a 3-run with its neighbours."""
+    if not EMPTY_CODE < code < SPECIAL_CODE_BASE:
+        return False  # Specials never match
+    size_r, size_c = len(cells), len(cells[0])
+    left = col
+    while left > 0 and cells[row][left - 1] == code:
+        left -= 1
+    right = col
+    while right < size_c - 1 and cells[row][right + 1] == code:
+        right += 1
+    if right - left >= 2:
+        return True
+    top = row
+    while top > 0 and cells[top - 1][col] == code:
+        top -= 1
+    bottom = row
+    while bottom < size_r - 1 and cells[bottom + 1][col] == code:
+        bottom += 1
+    return bottom - top >= 2
+
+
+def _line_runs(line):
+    """(start, length) of every run of 3+ equal regular pieces in a list of codes."""
+    runs = []
+    start = 0
+    for i in range(1, len(line) + 1):
+        if i == len(line) or line[i] != line[start]:
+            if i - start >= 3 and EMPTY_CODE < line[start] < SPECIAL_CODE_BASE:
+                runs.append((start, i - start))
+            start = i
+    return runs
+
+
+def _segments_from_starts(starts, horizontal):
+    """
+    Maximal runs as [horizontal, line, start, length] from the sorted (line, position) of every 3-run start.
+    Overlapping 3-starts on one line belong to the same run (they share cells, so the same piece).
+    """
+    segments = []
+    for line, j in starts:
+        if segments and segments[-1][1] == line and segments[-1][2] + segments[-1][3] - 2 == j:
+            segments[-1][3] += 1
+        else:
+            segments.append([horizontal, line, j, 3])
+    return segments
+
+
+def _component_specials(segments):
+    """
+    Joins runs that share a cell into connected groups (union-find over the runs) and returns
+    (pos, special_type, shape) for each group that earns a special tile, in the order found:
+      "5"    a run of 5 or more: color bomb in the middle of it
+      "T"/"L" crossing runs: bomb where they cross ("L" when they cross at both runs' ends)
+      "line" a lone run of 4: line tile along it, on its 2nd cell
+    Groups that are a lone run of 3 earn nothing.
+    """
+    parent = list(range(len(segments)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    crossings = []  # (cell, segment index, segment index)
+    for index, (horizontal, line, start, length) in enumerate(segments):
+        for k in range(start, start + length):
+            cell = (line, k) if horizontal else (k, line)
+            other = owner.setdefault(cell, index)
+            if other != index:
+                parent[find(index)] = find(other)
+                crossings.append((cell, other, index))
+
+    components = {}
+    for index in range(len(segments)):
+        components.setdefault(find(index), []).append(index)
+
+    specials = []
+    for members in components.values():
+        long_run = next((segments[i] for i in members if segments[i][3] >= 5), None)
+        crossing = next((crossing for crossing in crossings if find(crossing[1]) == find(members[0])), None)
+        if long_run is not None:
+            horizontal, line, start, _ = long_run
+            pos = (line, start + 2) if horizontal else (start + 2, line)
+            specials.append((pos, SPECIAL_COLOR_BOMB_TILE, "5"))
+        elif crossing is not None:
+            cell, a, b = crossing
+            at_ends = all(_cell_at_segment_end(cell, segments[i]) for i in (a, b))
+            specials.append((cell, SPECIAL_BOMB_TILE, "L" if at_ends else "T"))
+        elif segments[members[0]][3] == 4:
+            horizontal, line, start, _ = segments[members[0]]
+            if horizontal:
+                specials.append(((line, start + 1), SPECIAL_H_LINE_TILE, "line"))
+            else:
+                specials.append(((start + 1, line), SPECIAL_V_LINE_TILE, "line"))
+    return specials
+
+
+def _cell_at_segment_end(cell, segment):
+    horizontal, _, start, length = segment
+    k = cell[1] if horizontal else cell[0]
+    return k == start or k == start + length - 1
+
+
+def _run_starts(lines):
+    """
+    For a 2D code array scanned along axis 1, returns {3: mask, 4: mask, 5: mask} where
+    mask[i, j] is True if a run of at least that many equal regular pieces starts at (i, j).
+    """
+    width = lines.shape[1]
+    runs = {}
+    equal_next = _is_regular(lines[:, :-1]) & (lines[:, :-1] == lines[:, 1:])
+    run = np.ones((lines.shape[0], width), dtype=bool)
+    for length in range(2, 6):
+        # A run of `length` starts at j if a run of length-1 starts at j and j+length-2 equals its successor
+        span = max(0, width - length + 1)
+        run = run[:, :span] & equal_next[:, length - 2:length - 2 + span]
+        if length >= 3:
+            runs[length] = run
+    return runs
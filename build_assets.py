@@ -0,0 +1,50 @@
+"""
+Asset build step: scales every theme and special tile image to the tile sizes the board sizes in
+BOARD_SIZES use and packs them into ASSET_BUNDLE_FILE. The game reads the bundle with one file read
+and slices tiles out of it instead of decoding and scaling each PNG (see ImageCache.load_bundle).
+
+    python build_assets.py
+
+Run it again after changing images, TILE_SIZE or BOARD_SIZES. Tiles missing from the bundle are
+still loaded from their PNGs.
+"""
+import argparse
+import os
+import sys
+
+import pygame
+
+from assets import theme_image_paths, write_bundle
+from game import board_layout
+from constants import *
+
+
+def bundle_sizes():
+    """Tile sizes of every board size in BOARD_SIZES, TILE_SIZE included."""
+    return sorted({TILE_SIZE} | {board_layout(rows, cols)[0] for rows, cols in BOARD_SIZES}, reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-scale the tile images into one bundle file.")
+    parser.add_argument("--output", default=ASSET_BUNDLE_FILE, help="bundle file to write")
+    args = parser.parse_args(argv)
+
+    paths = sorted({path for pieces in THEMES.values() for path in theme_image_paths(pieces)})
+    images = {}
+    for path in paths:
+        try:
+            image = pygame.image.load(path)
+        except pygame.error as e:
+            print(f"Warning: Could not load tile image {path}, left out of the bundle. Error: {e}")
+            continue
+        for size in bundle_sizes():
+            images[(path, size)] = pygame.transform.scale(image, (size, size))
+
+    write_bundle(args.output, images)
+    print(f"{len(images)} tiles ({len(paths)} images at sizes {bundle_sizes()}) written to {args.output}, "
+          f"{os.path.getsize(args.output) // 1024} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 GAME_STATE_START = 0
 GAME_STATE_PLAYING = 1
 GAME_STATE_GAME_OVER = 2
+GAME_STATE_LOADING = 3  # Start pressed, waiting for the theme's images
 
 GRID_SIZE = 7
 TILE_SIZE = 60
@@ -9,6 +10,14 @@ SCREEN_WIDTH = GRID_SIZE * (TILE_SIZE + PADDING) - PADDING
 SCREEN_HEIGHT = GRID_SIZE * (TILE_SIZE + PADDING) + 100
 GAME_BOARD_OFFSET_Y = 100
 
+# Board sizes selectable on the start screen, as (rows, cols). Bigger boards get smaller tiles
+# so they fit in the largest window below; past MIN_TILE_SIZE they scroll instead.
+BOARD_SIZES = [(GRID_SIZE, GRID_SIZE), (30, 30), (20, 50)]
+MAX_SCREEN_WIDTH = 1280
+MAX_SCREEN_HEIGHT = 900
+MIN_TILE_SIZE = 20
+SCROLL_STEP = 3  # Cells per arrow key press / mouse wheel notch
+
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 BLUE = (135, 206, 250)
@@ -16,6 +25,7 @@ LIGHT_GRAY = (200, 200, 200)
 MUTED_BLUE = (173, 216, 230)
 BORDER_COLOR = (100, 100, 100)
 SELECTED_COLOR = (100, 149, 237)
+HINT_COLOR = (255, 215, 0)
 SCORE_TEXT_COLOR = BLACK
 TIME_TEXT_COLOR = BLACK
 
@@ -29,10 +39,17 @@ BONUS_MOVES_PER_MATCH = 0
 POINTS_PER_TILE = 10
 POINTS_PER_SPECIAL_ACTIVATION = 50 # Bonus points for using a special tile
 
-ANIM_SWAP_SPEED = 25
-ANIM_REMOVAL_SPEED = 30
-ANIM_DROP_SPEED = 70
-ANIM_SHAKE_SPEED = 25
+FPS = 30
+MAX_FRAME_TIME = 0.25  # Seconds; longer frames (window dragged, tab hidden) are clamped
+# With nothing moving on screen the loop sleeps until input arrives, waking at least this often (ms).
+# Keep it under MAX_FRAME_TIME so idle time (the hint delay) is counted in full.
+IDLE_WAIT_MS = 200
+
+# Animation durations in seconds
+ANIM_SWAP_DURATION = 0.25
+ANIM_REMOVAL_DURATION = 0.33
+ANIM_DROP_DURATION_PER_ROW = 0.07
+ANIM_SHAKE_DURATION = 0.15
 
 THEMES = {
     "Classic": ['visual/cone', 'visual/cross', 'visual/cube', 'visual/cylinder', 'visual/geometry'],
@@ -60,7 +77,41 @@ SPECIAL_TILE_IMAGES = {
 
 ALL_SPECIAL_TILE_TYPES = list(SPECIAL_TILE_IMAGES.keys())
 
+# Constructive board generation restarts this many times before giving up on keeping the reshuffled pieces
+BOARD_GENERATION_ATTEMPTS = 20
+
+# Scaled tile images kept in memory across games; all themes plus specials at one size is 39
+IMAGE_CACHE_MAX_ENTRIES = 64
+ASSET_BUNDLE_FILE = "tiles.bundle"  # Pre-scaled tile images, written by build_assets.py
+# Seconds the "Loading..." screen waits for the theme's images before the board loads what is left itself
+LOADING_TIMEOUT = 5
+# Rendered text runs and digit glyphs for the HUD, menus and profiler overlay
+TEXT_CACHE_MAX_ENTRIES = 256
+# python main.py --startup-time fails (exit status 1) when the first frame takes longer than this
+STARTUP_BUDGET_MS = 1000
+
+HINT_DELAY = 5  # Seconds without input before the best move is highlighted
+
+# Look-ahead solver (solver.py)
+SOLVER_BEAM_WIDTH = 4  # Lines kept after each ply
+SOLVER_DEPTH = 3  # Plies searched ahead
+SOLVER_BRANCHING = 6  # Best ranked swaps tried per position, on top of every special tile swap
+SOLVER_TABLE_SIZE = 50000  # Resolved (position, swap) pairs kept, about 0.5 KB each at 7x7 and 1.3 KB at 30x30
+
+# Profiler (F3 shows the overlay, F4 exports)
+PROFILER_MAX_FRAMES = 18000  # 10 minutes at FPS
+PROFILER_MAX_TRACE_EVENTS = 200000
+PROFILER_OVERLAY_FRAMES = 2 * FPS  # Averages, maxima and the histogram cover this many recent frames
+PROFILER_OVERLAY_SECTIONS = ["input", "update", "draw", "board_draw", "animations", "hud_text", "overlay",
+                             "cascade_step", "has_valid_moves", "reshuffle"]
+FRAME_TIME_BINS_MS = [2, 4, 8, 16, 33]  # Histogram bin edges; the last bin is everything above
+PROFILE_TRACE_FILE = "profile_trace.json"  # Chrome trace format
+PROFILE_CSV_FILE = "profile_frames.csv"
+PROFILER_TEXT_COLOR = (230, 230, 230)
+PROFILER_BACKGROUND_COLOR = (30, 30, 30)
+
 HIGH_SCORE_FILE = "high_score.txt"
+REPLAY_FILE = "last_game.m3r"  # Replay of the most recent game, see replay.py
 
 SOUNDS = {
     "match": "sounds/match.wav",
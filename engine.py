@@ -0,0 +1,169 @@
+import time
+from collections import deque
+from board_state import SPECIAL_CODES
+from profiler import profiler
+from constants import *
+
+# Event types produced by resolve_swap, in the order they happen
+EVENT_INVALID_SWAP = "invalid_swap"
+EVENT_SWAP = "swap"
+EVENT_CLEAR = "clear"
+EVENT_SPECIAL_CREATED = "special_created"
+EVENT_DROP = "drop"
+EVENT_REFILL = "refill"
+EVENT_RESHUFFLE = "reshuffle"
+
+
+class TurnResult:
+    """Outcome of one player swap: whether it was valid, what happened, and what it scored."""
+
+    def __init__(self):
+        self.valid = False
+        self.events = []
+        self.score_delta = 0
+        self.bonus_time = 0  # Only meaningful in MODE_TIME
+        self.cascade_steps = 0
+        self.specials_created = 0
+        self.reshuffled = False
+
+
+def resolve_swap(board, pos1, pos2, record_snapshots=False):
+    """
+    Plays one swap on a BoardState (or Board) including the whole cascade, special tile
+    activations and reshuffling, and returns a TurnResult. No pygame needed.
+
+    Every event is a dict with a "type" key (one of the EVENT_* constants). With
+    record_snapshots=True, swap/clear/drop/refill events also carry "cells", a copy of the board
+    codes at that moment, so a renderer can replay the turn after the board has settled.
+    """
+    result = TurnResult()
+
+    # Store original piece types at positions for potential swap-back or color bomb target
+    original_piece1_type = board.get_piece(pos1[0], pos1[1])
+    original_piece2_type = board.get_piece(pos2[0], pos2[1])
+    cells_before_swap = board.cells.copy() if record_snapshots else None
+
+    # Temporarily perform the swap on the board
+    board.swap_tiles(pos1, pos2)
+
+    # Special tiles that *will activate* in this cascade step
+    # Each entry: (r, c, target_type_for_color_bomb or None)
+    activated_specials_this_round = set()
+
+    # --- Initial Activation Check (direct swap of a special tile) ---
+    combo_cells = None
+    if original_piece1_type in SPECIAL_CODES and original_piece2_type in SPECIAL_CODES:
+        # Two specials swapped with each other fire once, as a combined effect where the player dropped the tile
+        combo_cells = board.get_tiles_to_clear_from_combo(pos2, original_piece1_type, original_piece2_type)
+    elif original_piece2_type in SPECIAL_CODES:  # Now sits at pos1
+        # Swapped a special with a regular tile: a color bomb targets the regular tile's type
+        activated_specials_this_round.add((pos1[0], pos1[1], original_piece1_type))
+    elif original_piece1_type in SPECIAL_CODES:  # Now sits at pos2
+        activated_specials_this_round.add((pos2[0], pos2[1], original_piece2_type))
+
+    # Get initial matches after swap (regular + potential special creation).
+    # The board was stable before the swap, so only the swapped rows/columns can match.
+    current_matched_coords, special_creation_data = board.check_match(dirty_cells={pos1, pos2})
+
+    # If no immediate matches AND no immediate special activations, it's an invalid swap.
+    if not current_matched_coords and not activated_specials_this_round and combo_cells is None:
+        board.swap_tiles(pos1, pos2)  # Swap back to original state
+        result.events.append({"type": EVENT_INVALID_SWAP, "pos1": pos1, "pos2": pos2,
+                              "pieces": (original_piece1_type, original_piece2_type)})
+        return result
+
+    result.valid = True
+    result.events.append({"type": EVENT_SWAP, "pos1": pos1, "pos2": pos2,
+                          "pieces": (original_piece1_type, original_piece2_type), "cells": cells_before_swap})
+
+    # --- Main Cascade Loop ---
+    while True:
+        step_start = time.perf_counter()
+        tiles_to_clear_in_this_cascade_step = set()
+        new_special_tiles_to_create = []  # List of (pos, type, shape) for special tiles to be created after drops
+        to_fire = deque(sorted(activated_specials_this_round, key=lambda s: (s[0], s[1])))
+        activated_specials_this_round.clear()
+        fired_this_step = set()
+        if combo_cells is not None:
+            tiles_to_clear_in_this_cascade_step.update(combo_cells)
+            fired_this_step.update((pos1, pos2))
+            to_fire.extend(_specials_in(board, combo_cells, fired_this_step))
+            combo_cells = None
+
+        # 1. Process all special tile activations for this step. A special caught in a blast fires in
+        # the same step, on the board as it is now, so a chain of specials resolves in one step.
+        while to_fire:
+            r, c, target_type = to_fire.popleft()
+            if (r, c) in fired_this_step:
+                continue
+            fired_this_step.add((r, c))
+            blast = board.get_tiles_to_clear_from_special(r, c, target_type)
+            tiles_to_clear_in_this_cascade_step.update(blast)
+            # For color bombs set off this way, target_type is None, leading to random color clear
+            to_fire.extend(_specials_in(board, blast, fired_this_step))
+
+        # 2. Add regular matched tiles to the set of tiles to clear
+        if current_matched_coords:
+            tiles_to_clear_in_this_cascade_step.update(current_matched_coords)
+            # One special tile per group of connected runs that earned one
+            new_special_tiles_to_create.extend(special_creation_data)
+
+        # 3. Check for termination condition for cascades
+        if not tiles_to_clear_in_this_cascade_step:
+            break  # No more tiles to clear from matches or special activations
+
+        # 4. Score update
+        step_score = len(tiles_to_clear_in_this_cascade_step) * POINTS_PER_TILE
+        result.score_delta += step_score
+        result.bonus_time += BONUS_TIME_PER_MATCH
+        result.cascade_steps += 1
+
+        cleared_cells = sorted(tiles_to_clear_in_this_cascade_step)
+        result.events.append({"type": EVENT_CLEAR, "cells_cleared": cleared_cells,
+                              "activated_specials": sorted(fired_this_step),
+                              "score": step_score, "bonus_time": BONUS_TIME_PER_MATCH,
+                              "cells": board.cells.copy() if record_snapshots else None})
+
+        # 5. Remove tiles from the board
+        board.remove_tiles(tiles_to_clear_in_this_cascade_step)
+
+        # 6. Create newly generated special tiles (from previous matches)
+        for pos, type_name, shape in new_special_tiles_to_create:
+            # Only place if the spot is currently empty (not cleared by another special that activates later)
+            if board.get_piece(pos[0], pos[1]) is None:
+                board.set_piece(pos[0], pos[1], type_name)
+                result.specials_created += 1
+                result.events.append({"type": EVENT_SPECIAL_CREATED, "pos": pos, "special_type": type_name,
+                                      "shape": shape})
+
+        # 7. Drop and Refill
+        drop = board.drop_pieces()
+        changed_cells = drop.changed_cells
+        result.events.append({"type": EVENT_DROP, "moves": drop.moves, "fall_distances": drop.fall_distances,
+                              "cells": board.cells.copy() if record_snapshots else None})
+        filled_cells = board.refill_grid()
+        result.events.append({"type": EVENT_REFILL, "cells_filled": sorted(filled_cells),
+                              "cells": board.cells.copy() if record_snapshots else None})
+        changed_cells |= filled_cells
+
+        # 8. Prepare for next iteration: Find new regular matches.
+        # Everything that did not move was already match-free, so only rescan around changed cells.
+        current_matched_coords, special_creation_data = board.check_match(dirty_cells=changed_cells)
+        profiler.record("cascade_step", step_start)
+
+    # After the cascade loop finishes
+    with profiler.section("has_valid_moves"):
+        has_valid_moves = board.has_valid_moves()
+    if not has_valid_moves:
+        with profiler.section("reshuffle"):
+            board.reshuffle_board()
+        result.reshuffled = True
+        result.events.append({"type": EVENT_RESHUFFLE})
+
+    return result
+
+
+def _specials_in(board, cells, fired):
+    """(r, c, None) for every special tile in cells that has not fired yet, in row-major order."""
+    return [(r, c, None) for r, c in sorted(cells)
+            if (r, c) not in fired and board.get_piece(r, c) in SPECIAL_CODES]
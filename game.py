@@ -1,25 +1,57 @@
+import asyncio
 import pygame
-import time
 import json
 import random
+import sys
+import time
+from assets import image_cache, text_cache, theme_image_paths, THREADS_AVAILABLE
 from board import Board
+from board_state import EMPTY_CODE
+from replay import Replay
+from profiler import profiler
+from animation import AnimationTimeline, Tween, ShakeTween, ease_in_quad
+from engine import resolve_swap, EVENT_SWAP, EVENT_CLEAR, EVENT_SPECIAL_CREATED, EVENT_DROP, EVENT_REFILL, \
+    EVENT_RESHUFFLE
 from constants import *
 
 
 # Removed: from pygame import mixer
 
+# Blocking in pygame.event.wait would freeze the browser tab, the web build (pygbag) always ticks at FPS
+EVENT_WAIT_AVAILABLE = sys.platform != "emscripten"
+
+
+def board_layout(rows, cols):
+    """
+    Tile size, padding and window size for a rows x cols board. Tiles shrink (down to MIN_TILE_SIZE)
+    until the board fits in MAX_SCREEN_WIDTH x MAX_SCREEN_HEIGHT; boards that still don't fit scroll.
+    """
+    pitch = min(TILE_SIZE + PADDING,
+                (MAX_SCREEN_WIDTH + PADDING) // cols,
+                (MAX_SCREEN_HEIGHT - GAME_BOARD_OFFSET_Y) // rows)
+    padding = max(1, round(pitch * PADDING / (TILE_SIZE + PADDING)))
+    tile_size = max(MIN_TILE_SIZE, pitch - padding)
+    pitch = tile_size + padding
+    # Never smaller than the default window, the menus are laid out for that
+    screen_width = max(SCREEN_WIDTH, min(MAX_SCREEN_WIDTH, cols * pitch - padding))
+    screen_height = max(SCREEN_HEIGHT, min(MAX_SCREEN_HEIGHT, rows * pitch + GAME_BOARD_OFFSET_Y))
+    return tile_size, padding, (screen_width, screen_height)
+
+
 class Game:
-    def __init__(self):
-        pygame.init()
+    def __init__(self, rows=GRID_SIZE, cols=None):
+        # Only the subsystems the game uses; pygame.init() would also start audio and joysticks
+        pygame.display.init()
+        pygame.font.init()
         # Removed: mixer.init()
         pygame.display.set_caption("Pygame Match-3")
 
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.board_size = (rows, cols or rows)
+        self.screen_width, self.screen_height = board_layout(*self.board_size)[2]
+        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         self.clock = pygame.time.Clock()
 
-        self.default_font = pygame.font.Font(pygame.font.get_default_font(), 24)
-        self.font26 = pygame.font.Font(pygame.font.get_default_font(), 26)
-        self.font32 = pygame.font.Font(pygame.font.get_default_font(), 32)
+        self._fonts = {}  # size -> Font, opened on first use
 
         self.current_state = GAME_STATE_START
         self.game_mode = MODE_TIME
@@ -27,18 +59,58 @@ class Game:
         self.selected_theme_pieces = THEMES[self.selected_theme_name]
 
         self.board = None
+        self.replay = None
         self.score = 0
         self.high_score = self._load_high_score()
         self.total_time = DEFAULT_TIME
         self.moves_left = DEFAULT_MOVES
-        self.start_time = 0
+        self.elapsed_time = 0.0
+        self.idle_time = 0.0  # Since the last click, for the hint
+        self.loading_time = 0.0  # Since Start was pressed, while the theme's images load
         self.selected_tile = None
+        self.animations = AnimationTimeline()
+
+        # Dirty-rectangle rendering state
+        self._full_redraw = True
+        self._drawn_hud_text = None
+        self._last_tween_rects = []
+
+        self.show_profiler = False
+
+        # Tile images are loaded once the start screen is up (see run), or earlier if a menu key needs them
+        self._bundle_loaded = False
+        self._startup_times = None  # Set by measure_startup
+        self.exit_status = 0
 
         # Removed: self._load_sounds()
 
     # Removed: _load_sounds method
     # Removed: _play_sound method
 
+    def _font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            font = self._fonts[size] = pygame.font.Font(pygame.font.get_default_font(), size)
+        return font
+
+    def measure_startup(self, start_time, imported_time):
+        """
+        Makes run() report how long it took to get the first frame on screen and quit right after.
+        start_time and imported_time are time.perf_counter() values from before and after main.py's imports.
+        """
+        self._startup_times = (start_time, imported_time, time.perf_counter())
+
+    def _report_startup(self):
+        start_time, imported_time, created_time = self._startup_times
+        now = time.perf_counter()
+        total_ms = (now - start_time) * 1000
+        print(f"Startup: imports {(imported_time - start_time) * 1000:.1f} ms, "
+              f"Game() {(created_time - imported_time) * 1000:.1f} ms, "
+              f"first frame {(now - created_time) * 1000:.1f} ms, "
+              f"total {total_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+        if total_ms > STARTUP_BUDGET_MS:
+            self.exit_status = 1
+
     def _load_high_score(self):
         try:
             with open(HIGH_SCORE_FILE, 'r') as f:
@@ -50,29 +122,92 @@ class Game:
         with open(HIGH_SCORE_FILE, 'w') as f:
             f.write(str(self.high_score))
 
-    def run(self):
+    def _save_replay(self):
+        try:
+            self.replay.save(REPLAY_FILE)
+        except OSError as e:
+            print(f"Warning: Could not save replay {REPLAY_FILE}. Error: {e}")
+
+    async def run(self):
+        """
+        The main loop. It is a coroutine so the pygbag web build can hand control back to the
+        browser once per frame; on the desktop, run it with asyncio.run(game.run()).
+        """
         running = True
+        first_frame = True
         while running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
+            if first_frame or self._needs_full_rate():
+                events_waited = []
+                # Delta time drives the animations and the game timer
+                dt = min(self.clock.tick(FPS) / 1000, MAX_FRAME_TIME)
+            else:
+                # Nothing on screen changes by itself, so sleep until there is input (NOEVENT on timeout)
+                event = pygame.event.wait(IDLE_WAIT_MS)
+                events_waited = [event] if event.type != pygame.NOEVENT else []
+                dt = min(self.clock.tick() / 1000, MAX_FRAME_TIME)
+            # A profiled frame is the work between two ticks, the wait for the next frame is left out
+            profiler.begin_frame()
+            with profiler.section("input"):
+                for event in events_waited + pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+                    elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                        self._full_redraw = True
+                    self._handle_input(event)
+            with profiler.section("update"):
+                self._update(dt)
+            with profiler.section("draw"):
+                self._draw()
+            profiler.end_frame()
+            if first_frame:
+                first_frame = False
+                if self._startup_times is not None:
+                    self._report_startup()
                     running = False
-                self._handle_input(event)
-
-            self._update()
-            self._draw()
+                else:
+                    self._preload_selected_theme()
+            await asyncio.sleep(0)
 
-            self.clock.tick(30)
         pygame.quit()
         self._save_high_score()
+        if self.current_state == GAME_STATE_PLAYING:
+            self._save_replay()  # Quit mid-game
+
+    def _needs_full_rate(self):
+        """
+        True while the screen changes without input: animations, the time-mode countdown, a theme
+        loading, the profiler overlay. Otherwise run() idles in pygame.event.wait.
+        """
+        if not EVENT_WAIT_AVAILABLE or self.show_profiler or self.current_state == GAME_STATE_LOADING:
+            return True
+        if self.current_state == GAME_STATE_PLAYING:
+            return self.animations.busy or self.game_mode == MODE_TIME
+        return False
 
     def _handle_input(self, event):
-        if self.current_state == GAME_STATE_START:
+        if event.type == pygame.KEYDOWN and event.key in (pygame.K_F3, pygame.K_F4):
+            self._handle_profiler_key(event.key)
+        elif self.current_state == GAME_STATE_START:
             self._handle_start_screen_input(event)
+            self._full_redraw = True  # The menu is cheap and only redrawn on input
+        elif self.current_state == GAME_STATE_LOADING:
+            self._handle_loading_input(event)
         elif self.current_state == GAME_STATE_PLAYING:
             self._handle_game_play_input(event)
         elif self.current_state == GAME_STATE_GAME_OVER:
             self._handle_game_over_input(event)
 
+    def _handle_profiler_key(self, key):
+        if key == pygame.K_F3:
+            # Profiling only runs while the overlay is shown
+            self.show_profiler = not self.show_profiler
+            profiler.set_enabled(self.show_profiler)
+            self._full_redraw = True  # Clears the overlay when it is hidden
+        elif profiler.frames:
+            profiler.export_chrome_trace(PROFILE_TRACE_FILE)
+            profiler.export_csv(PROFILE_CSV_FILE)
+            print(f"Profile written to {PROFILE_TRACE_FILE} and {PROFILE_CSV_FILE}")
+
     def _handle_start_screen_input(self, event):
         if event.type == pygame.KEYDOWN:
             if event.key == pygame.K_1:
@@ -84,20 +219,54 @@ class Game:
                 current_idx = themes.index(self.selected_theme_name)
                 self.selected_theme_name = themes[(current_idx - 1) % len(themes)]
                 self.selected_theme_pieces = THEMES[self.selected_theme_name]
+                self._preload_selected_theme()
             elif event.key == pygame.K_RIGHT:
                 themes = list(THEMES.keys())
                 current_idx = themes.index(self.selected_theme_name)
                 self.selected_theme_name = themes[(current_idx + 1) % len(themes)]
                 self.selected_theme_pieces = THEMES[self.selected_theme_name]
+                self._preload_selected_theme()
+            elif event.key in (pygame.K_UP, pygame.K_DOWN):
+                sizes = BOARD_SIZES if self.board_size in BOARD_SIZES else [self.board_size] + BOARD_SIZES
+                step = 1 if event.key == pygame.K_DOWN else -1
+                self.board_size = sizes[(sizes.index(self.board_size) + step) % len(sizes)]
+                self._preload_selected_theme()
             elif event.key == pygame.K_RETURN:
-                self._start_game()
+                self._request_start()
 
-    def _handle_game_play_input(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            x, y = event.pos
-            row, col = (y - GAME_BOARD_OFFSET_Y) // (TILE_SIZE + PADDING), x // (TILE_SIZE + PADDING)
+    def _handle_loading_input(self, event):
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_RETURN:
+                self._start_game()  # Don't wait, the board loads what is missing itself
+            elif event.key == pygame.K_ESCAPE:
+                self.current_state = GAME_STATE_START
+                self._full_redraw = True
+
+    def _preload_selected_theme(self):
+        if not self._bundle_loaded:
+            image_cache.load_bundle(ASSET_BUNDLE_FILE)
+            self._bundle_loaded = True
+        # Decode the highlighted theme in the background while the player is still browsing
+        image_cache.preload(theme_image_paths(self.selected_theme_pieces), board_layout(*self.board_size)[0])
 
-            if 0 <= row < GRID_SIZE and 0 <= col < GRID_SIZE:
+    def _handle_game_play_input(self, event):
+        # Scrolling works even while a move plays; it only matters for boards bigger than the window
+        pitch = self.board.tile_size + self.board.padding
+        if event.type == pygame.MOUSEWHEEL:
+            self.board.scroll_by(-event.x * pitch * SCROLL_STEP, -event.y * pitch * SCROLL_STEP)
+        elif event.type == pygame.KEYDOWN:
+            scroll = {pygame.K_LEFT: (-1, 0), pygame.K_RIGHT: (1, 0), pygame.K_UP: (0, -1), pygame.K_DOWN: (0, 1)}
+            if event.key in scroll:
+                dx, dy = scroll[event.key]
+                self.board.scroll_by(dx * pitch * SCROLL_STEP, dy * pitch * SCROLL_STEP)
+
+        # The board is ignored until the previous move has finished playing.
+        # Buttons 4 and up are wheel/extra buttons.
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button <= 3 and not self.animations.busy:
+            self.idle_time = 0.0
+            cell = self.board.cell_at(event.pos)
+            if cell is not None:
+                row, col = cell
                 if self.selected_tile:
                     if self.board.valid_swap_positions(self.selected_tile, (row, col)):
                         self._handle_tile_swap(self.selected_tile, (row, col))
@@ -110,290 +279,328 @@ class Game:
     def _handle_game_over_input(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
             self.current_state = GAME_STATE_START
+            self._full_redraw = True
+
+    def _selected_theme_loaded(self):
+        return image_cache.ready(theme_image_paths(self.selected_theme_pieces), board_layout(*self.board_size)[0])
+
+    def _request_start(self):
+        # The board is only built once its images are loaded, so the window keeps drawing meanwhile
+        if self._selected_theme_loaded():
+            self._start_game()
+        else:
+            self._preload_selected_theme()
+            self.current_state = GAME_STATE_LOADING
+            self.loading_time = 0.0
+            self._full_redraw = True
 
     def _start_game(self):
-        self.board = Board(self.selected_theme_pieces)
+        tile_size, padding, screen_size = board_layout(*self.board_size)
+        if screen_size != (self.screen_width, self.screen_height):
+            self.screen_width, self.screen_height = screen_size
+            self.screen = pygame.display.set_mode(screen_size)
+        viewport = pygame.Rect(0, GAME_BOARD_OFFSET_Y, self.screen_width, self.screen_height - GAME_BOARD_OFFSET_Y)
+        self.board = Board(self.selected_theme_pieces, *self.board_size, tile_size=tile_size, padding=padding,
+                           viewport=viewport)
+        self.replay = Replay(self.board.seed, self.game_mode, self.selected_theme_name, *self.board_size)
         self.score = 0
         self.total_time = DEFAULT_TIME if self.game_mode == MODE_TIME else 0
         self.moves_left = DEFAULT_MOVES if self.game_mode == MODE_MOVES else 0
-        self.start_time = time.time()
+        self.elapsed_time = 0.0
+        self.idle_time = 0.0
         self.selected_tile = None
+        self.animations.clear()
+        self._last_tween_rects = []
         self.current_state = GAME_STATE_PLAYING
+        self._full_redraw = True
         # Removed: mixer.music.play(-1)
 
-    def _update(self):
+    def _update(self, dt):
+        if not THREADS_AVAILABLE:
+            image_cache.pump()
+        if self.current_state == GAME_STATE_LOADING:
+            self.loading_time += dt
+            # Past the timeout the board loads the rest itself, with fallback tiles for images that fail
+            if self._selected_theme_loaded() or self.loading_time >= LOADING_TIMEOUT:
+                self._start_game()
         if self.current_state == GAME_STATE_PLAYING:
-            self._update_game_play()
+            self._update_game_play(dt)
 
-    def _update_game_play(self):
+    def _update_game_play(self, dt):
+        self.animations.update(dt)
+        # The clock only runs while the player can act, board clicks are ignored while a move plays
+        if not self.animations.busy:
+            self.elapsed_time += dt
+            self.idle_time += dt
+
+        # The game only ends once the last move has finished playing, so its points still count
         if self.game_mode == MODE_TIME:
-            elapsed_time = int(time.time() - self.start_time)
-            remaining = max(0, self.total_time - elapsed_time)
-            if remaining == 0:
-                self._end_game()
-                return
+            remaining = max(0, self.total_time - int(self.elapsed_time))
             self.moves_left_or_time = remaining
+            if remaining == 0 and not self.animations.busy:
+                self._end_game()
         else:
             self.moves_left_or_time = self.moves_left
-            if self.moves_left <= 0:
+            if self.moves_left <= 0 and not self.animations.busy:
                 self._end_game()
-                return
-
-        if not self.board.has_valid_moves():
-            self.board.reshuffle_board()
 
     def _end_game(self):
         self.high_score = max(self.high_score, self.score)
         self._save_high_score()
         self.current_state = GAME_STATE_GAME_OVER
+        self._full_redraw = True
+        self._save_replay()
         # Removed: mixer.music.stop()
         # Removed: self._play_sound("game_over")
 
     def _draw(self):
-        self.screen.fill(MUTED_BLUE)
-        if self.current_state == GAME_STATE_START:
-            self._draw_start_screen()
-        elif self.current_state == GAME_STATE_PLAYING:
-            self._draw_game_play()
-        elif self.current_state == GAME_STATE_GAME_OVER:
-            self._draw_game_over_screen()
-        pygame.display.flip()
+        # While playing, only what changed is repainted and pushed to the display.
+        # Everything else (menus, state changes, window exposure) repaints the whole screen once.
+        if self.current_state == GAME_STATE_PLAYING and not self._full_redraw:
+            dirty_rects = self._draw_game_play()
+        elif self._full_redraw:
+            self._full_redraw = False
+            self.screen.fill(MUTED_BLUE)
+            if self.current_state in (GAME_STATE_START, GAME_STATE_LOADING):
+                self._draw_start_screen()
+            elif self.current_state == GAME_STATE_PLAYING:
+                self.board.invalidate()
+                self._drawn_hud_text = None
+                self._draw_game_play()
+            elif self.current_state == GAME_STATE_GAME_OVER:
+                self._draw_game_over_screen()
+            dirty_rects = None  # The whole screen
+        else:
+            dirty_rects = []  # Static screen, nothing changed since it was drawn
+
+        if self.show_profiler:
+            # Drawn last and opaque, so it never needs what is underneath repainted
+            with profiler.section("overlay"):
+                overlay_rect = self._draw_profiler_overlay()
+            if dirty_rects is not None:
+                dirty_rects.append(overlay_rect)
+
+        if dirty_rects is None:
+            pygame.display.flip()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
 
     def _draw_start_screen(self):
-        self._draw_text("Select Game Mode:", self.font32, BLACK, (SCREEN_WIDTH // 2, 50))
-        self._draw_text("1. Play with Time", self.font26, BLACK, (SCREEN_WIDTH // 2, 100))
-        self._draw_text("2. Play with Moves", self.font26, BLACK, (SCREEN_WIDTH // 2, 150))
+        center_x = self.screen_width // 2
+        self._draw_text("Select Game Mode:", self._font(32), BLACK, (center_x, 50))
+        self._draw_text("1. Play with Time", self._font(26), BLACK, (center_x, 100))
+        self._draw_text("2. Play with Moves", self._font(26), BLACK, (center_x, 150))
 
-        self._draw_text("Select Theme:", self.font32, BLACK, (SCREEN_WIDTH // 2, 300))
-        self._draw_text("Left/Right to Change", self.font26, BLACK, (SCREEN_WIDTH // 2, 350))
+        self._draw_text("Select Theme:", self._font(32), BLACK, (center_x, 300))
+        self._draw_text("Left/Right to Change", self._font(26), BLACK, (center_x, 350))
 
-        self._draw_text(f"Mode: {self.game_mode}", self.default_font, BLACK, (SCREEN_WIDTH - 100, 450))
-        self._draw_text(f"Theme: {self.selected_theme_name}", self.default_font, BLACK, (125, 450))
+        rows, cols = self.board_size
+        self._draw_text(f"Board: {cols}x{rows} (Up/Down)", self._font(24), BLACK, (center_x, 400))
+        self._draw_text(f"Mode: {self.game_mode}", self._font(24), BLACK, (self.screen_width - 100, 450))
+        self._draw_text(f"Theme: {self.selected_theme_name}", self._font(24), BLACK, (125, 450))
 
-        self._draw_text("Press Enter to Start", self.default_font, BLACK, (SCREEN_WIDTH // 2, 500))
+        if self.current_state == GAME_STATE_LOADING:
+            prompt = "Loading... (Enter: Start Now, Esc: Back)"
+        else:
+            prompt = "Press Enter to Start"
+        self._draw_text(prompt, self._font(24), BLACK, (center_x, 500))
 
     def _draw_game_play(self):
-        self.board.draw(self.screen, self.selected_tile)
-        self._draw_score_and_time()
+        """Draws the changed parts of the board and HUD; returns the screen rects that were updated."""
+        # Cells under moving tiles, both where they were last frame and where they are now, get repainted
+        tween_rects = self.animations.rects(self.board.screen_offset)
+        extra_dirty_cells = set()
+        for rect in self._last_tween_rects + tween_rects:
+            extra_dirty_cells |= self.board.cells_in_rect(rect)
+        self._last_tween_rects = tween_rects
+
+        # After a while without input the best move is outlined, until the next click
+        hint = None
+        if self.idle_time >= HINT_DELAY and self.selected_tile is None and not self.animations.busy:
+            hint = self.board.best_move()
+
+        # While animating, the board is drawn from the snapshot of the current phase
+        with profiler.section("board_draw"):
+            dirty_rects = self.board.draw(self.screen, self.selected_tile, self.animations.current_cells(),
+                                          extra_dirty_cells, hint)
+        if self.animations.busy:
+            # Tiles falling in from above must not draw over the HUD
+            with profiler.section("animations"):
+                self.screen.set_clip(self.board.viewport)
+                self.animations.draw(self.screen, self.board.images, self.board.screen_offset)
+                self.screen.set_clip(None)
+
+        # The HUD separator line overlaps the top row, so put it back if that row was repainted
+        separator_rect = pygame.Rect(0, GAME_BOARD_OFFSET_Y, self.screen_width, 2)
+        if separator_rect.collidelist(dirty_rects) != -1:
+            pygame.draw.line(self.screen, BLACK, (0, GAME_BOARD_OFFSET_Y), (self.screen_width, GAME_BOARD_OFFSET_Y), 2)
+            dirty_rects.append(separator_rect)
+        with profiler.section("hud_text"):
+            dirty_rects.extend(self._draw_score_and_time())
+        return dirty_rects
+
+    def _draw_profiler_overlay(self):
+        """Per-section timings, check_match calls and a frame-time histogram over the recent frames."""
+        frames = profiler.recent_frames(PROFILER_OVERLAY_FRAMES)
+        line_height = 16
+        rect = pygame.Rect(4, GAME_BOARD_OFFSET_Y + 4, 250, line_height * (len(PROFILER_OVERLAY_SECTIONS) + 4) + 60)
+        self.screen.fill(PROFILER_BACKGROUND_COLOR, rect)
+        if not frames:
+            return rect
+
+        def ms_stats(values):
+            return sum(values) / len(frames) * 1000, max(values) * 1000
+
+        def text(line, x, y, right_align=False):
+            if right_align:
+                text_cache.draw(self.screen, line, self._font(14), PROFILER_TEXT_COLOR, topright=(x, y))
+            else:
+                text_cache.draw(self.screen, line, self._font(14), PROFILER_TEXT_COLOR, topleft=(x, y))
+
+        x, y = rect.x + 6, rect.y + 4
+        elapsed = frames[-1]["start"] - frames[0]["start"]
+        fps = (len(frames) - 1) / elapsed if elapsed > 0 else 0
+        avg, peak = ms_stats([frame["duration"] for frame in frames])
+        text(f"{fps:.0f} FPS, frame {avg:.1f} / {peak:.1f} ms", x, y)
+        y += line_height
+        text("ms per frame", x, y)
+        text("avg", x + 170, y, right_align=True)
+        text("max", x + 230, y, right_align=True)
+        for name in PROFILER_OVERLAY_SECTIONS:
+            y += line_height
+            avg, peak = ms_stats([frame["sections"].get(name, 0.0) for frame in frames])
+            text(name, x, y)
+            text(f"{avg:.2f}", x + 170, y, right_align=True)
+            text(f"{peak:.2f}", x + 230, y, right_align=True)
+        y += line_height
+        check_matches = [frame["counts"].get("check_match", 0) for frame in frames]
+        text(f"check_match/frame {check_matches[-1]} (max {max(check_matches)})", x, y)
+
+        # Frame-time histogram: one bar per bin, heights relative to the fullest bin
+        y += line_height + 4
+        counts = [0] * (len(FRAME_TIME_BINS_MS) + 1)
+        for frame in frames:
+            duration_ms = frame["duration"] * 1000
+            counts[sum(duration_ms >= edge for edge in FRAME_TIME_BINS_MS)] += 1
+        labels = [f"<{edge}" for edge in FRAME_TIME_BINS_MS] + [f"{FRAME_TIME_BINS_MS[-1]}+"]
+        bar_width, bar_area = 36, 30
+        for i, (count, label) in enumerate(zip(counts, labels)):
+            bar_height = round(bar_area * count / max(counts))
+            bar_x = x + i * (bar_width + 4)
+            pygame.draw.rect(self.screen, PROFILER_TEXT_COLOR, (bar_x, y + bar_area - bar_height, bar_width, bar_height))
+            text(label, bar_x, y + bar_area + 2)
+        return rect
 
     def _draw_game_over_screen(self):
         self.screen.fill(BLACK)
-        self._draw_text("GAME OVER", self.font32, WHITE, (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 60))
-        self._draw_text(f"Your Score: {self.score}", self.default_font, WHITE,
-                        (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 20))
-        self._draw_text(f"High Score: {self.high_score}", self.default_font, WHITE,
-                        (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 20))
-        self._draw_text("Click to PLAY AGAIN", self.default_font, WHITE, (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 60))
+        center_x, center_y = self.screen_width // 2, self.screen_height // 2
+        self._draw_text("GAME OVER", self._font(32), WHITE, (center_x, center_y - 60))
+        self._draw_text(f"Your Score: {self.score}", self._font(24), WHITE, (center_x, center_y - 20))
+        self._draw_text(f"High Score: {self.high_score}", self._font(24), WHITE, (center_x, center_y + 20))
+        self._draw_text("Click to PLAY AGAIN", self._font(24), WHITE, (center_x, center_y + 60))
 
     def _draw_text(self, text, font, color, center):
-        render = font.render(text, True, color)
-        rect = render.get_rect(center=center)
-        self.screen.blit(render, rect)
+        text_cache.draw(self.screen, text, font, color, center=center)
 
     def _draw_score_and_time(self):
-        pygame.draw.rect(self.screen, LIGHT_GRAY, (0, 0, SCREEN_WIDTH, GAME_BOARD_OFFSET_Y))
-        pygame.draw.line(self.screen, BLACK, (0, GAME_BOARD_OFFSET_Y), (SCREEN_WIDTH, GAME_BOARD_OFFSET_Y), 2)
-        score_text = self.default_font.render(f"Score: {self.score}", True, SCORE_TEXT_COLOR)
-        time_text = self.default_font.render(f"{self.game_mode}: {self.moves_left_or_time}", True, TIME_TEXT_COLOR)
-        self.screen.blit(score_text, (20, 30))
-        self.screen.blit(time_text, (SCREEN_WIDTH - 120, 30))
+        """Redraws the HUD only when its text changed; returns the updated rects."""
+        hud_text = (f"Score: {self.score}", f"{self.game_mode}: {self.moves_left_or_time}")
+        if hud_text == self._drawn_hud_text:
+            return []
+        self._drawn_hud_text = hud_text
+
+        hud_rect = pygame.Rect(0, 0, self.screen_width, GAME_BOARD_OFFSET_Y + 2)
+        self.screen.fill(MUTED_BLUE, hud_rect)
+        pygame.draw.rect(self.screen, LIGHT_GRAY, (0, 0, self.screen_width, GAME_BOARD_OFFSET_Y))
+        pygame.draw.line(self.screen, BLACK, (0, GAME_BOARD_OFFSET_Y), (self.screen_width, GAME_BOARD_OFFSET_Y), 2)
+        text_cache.draw(self.screen, hud_text[0], self._font(24), SCORE_TEXT_COLOR, topleft=(20, 30))
+        text_cache.draw(self.screen, hud_text[1], self._font(24), TIME_TEXT_COLOR, topleft=(self.screen_width - 120, 30))
+        return [hud_rect]
 
     def _handle_tile_swap(self, pos1, pos2):
-        # Store original piece types at positions for potential swap-back or color bomb target
-        original_piece1_type = self.board.get_piece(pos1[0], pos1[1])
-        original_piece2_type = self.board.get_piece(pos2[0], pos2[1])
-
-        # Temporarily perform the swap on the board
-        self.board.swap_tiles(pos1, pos2)
-
-        # List of special tiles that *will activate* in this cascade step
-        # Each entry: (r, c, target_type_for_color_bomb or None)
-        activated_specials_this_round = set()
-
-        # --- Initial Activation Check (direct swap of a special tile) ---
-        # Get the types *after* the swap to handle cases where a special tile was newly created
-        current_piece1_after_swap = self.board.get_piece(pos1[0], pos1[1])
-        current_piece2_after_swap = self.board.get_piece(pos2[0], pos2[1])
-
-        if current_piece1_after_swap in ALL_SPECIAL_TILE_TYPES:
-            # If swapped a special with a regular tile, target is the regular tile's type
-            target = original_piece2_type if original_piece2_type not in ALL_SPECIAL_TILE_TYPES else None
-            activated_specials_this_round.add((pos1[0], pos1[1], target))
-
-        if current_piece2_after_swap in ALL_SPECIAL_TILE_TYPES:
-            # If swapped a special with a regular tile, target is the regular tile's type
-            target = original_piece1_type if original_piece1_type not in ALL_SPECIAL_TILE_TYPES else None
-            activated_specials_this_round.add((pos2[0], pos2[1], target))
-
-        # Get initial matches after swap (regular + potential special creation)
-        current_matched_coords, special_creation_data = self.board.check_match()
-
-        # If no immediate matches AND no immediate special activations, it's an invalid swap.
-        if not current_matched_coords and not activated_specials_this_round:
-            self._animate_shake(pos1, pos2)
-            self.board.swap_tiles(pos1, pos2)  # Swap back to original state
+        # The engine resolves the whole turn up front; here we only queue its events for playback
+        self.replay.record_swap(self.elapsed_time, pos1, pos2)
+        result = resolve_swap(self.board, pos1, pos2, record_snapshots=True)
+
+        if not result.valid:
             # Removed: self._play_sound("invalid_swap")
+            self._queue_shake(pos1, pos2)
             return
 
-        # Valid move: Animate the swap
-        # Removed: self._play_sound("swap")
-        self._animate_swap(pos1, pos2)
-
         # Deduct move count for the initial successful swap
         if self.game_mode == MODE_MOVES:
             self.moves_left -= 1
 
-        # --- Main Cascade Loop ---
-        while True:
-            tiles_to_clear_in_this_cascade_step = set()
-            new_special_tiles_to_create = []  # List of (pos, type) for special tiles to be created after drops
-
-            # 1. Process all special tile activations for this step
-            if activated_specials_this_round:
-                # Removed: self._play_sound("special_activate")
-                for r, c, target_type in activated_specials_this_round:
-                    # To handle recursive activation (special clears special),
-                    # we first get the affected tiles based on the current board state *before* nulling out the special tile.
-                    affected_by_this_special = self.board.get_tiles_to_clear_from_special(r, c, target_type)
-                    tiles_to_clear_in_this_cascade_step.update(affected_by_this_special)
-                    tiles_to_clear_in_this_cascade_step.add((r, c))  # Ensure the special tile itself is cleared
-                activated_specials_this_round.clear()  # Processed all activations for this step
-
-            # 2. Add regular matched tiles to the set of tiles to clear
-            if current_matched_coords:
-                tiles_to_clear_in_this_cascade_step.update(current_matched_coords)
-                # If a special tile should be created from these matches
-                if special_creation_data[0] is not None:
-                    new_special_tiles_to_create.append(special_creation_data)
-
-            # 3. Check for termination condition for cascades
-            if not tiles_to_clear_in_this_cascade_step:
-                break  # No more tiles to clear from matches or special activations
-
-            # 4. Score update & animation
-            self.score += len(tiles_to_clear_in_this_cascade_step) * POINTS_PER_TILE
+        drop_event = None
+        for event in result.events:
+            if event["type"] == EVENT_SWAP:
+                # Removed: self._play_sound("swap")
+                self._queue_swap(pos1, pos2, event["pieces"], event["cells"])
+            elif event["type"] == EVENT_CLEAR:
+                # Removed: self._play_sound("match")
+                self._queue_removal(event)
+            elif event["type"] == EVENT_SPECIAL_CREATED:
+                print(f"Created special tile {event['special_type']} at {event['pos']}")
+            elif event["type"] == EVENT_DROP:
+                drop_event = event
+            elif event["type"] == EVENT_REFILL:
+                self._queue_drop(drop_event, event)
+                # Removed: self._play_sound("drop") # Re-play drop sound for each cascade
+            elif event["type"] == EVENT_RESHUFFLE:
+                print("No valid moves found, reshuffling board!")
+
+    # --- Animation scheduling (engine events -> timeline phases; removed internal sound calls) ---
+    def _queue_swap(self, pos1, pos2, pieces, cells):
+        # Each piece slides from its original position to the other one
+        background = cells.copy()
+        background[pos1] = background[pos2] = EMPTY_CODE
+        cell_position, size = self.board.cell_position, self.board.tile_size
+        self.animations.add_phase([
+            Tween(pieces[0], cell_position(*pos1), cell_position(*pos2), ANIM_SWAP_DURATION, size=size),
+            Tween(pieces[1], cell_position(*pos2), cell_position(*pos1), ANIM_SWAP_DURATION, size=size),
+        ], background)
+
+    def _queue_shake(self, pos1, pos2):
+        background = self.board.cells.copy()
+        background[pos1] = background[pos2] = EMPTY_CODE
+        cell_position, size = self.board.cell_position, self.board.tile_size
+        self.animations.add_phase([
+            ShakeTween(self.board.get_piece(*pos1), cell_position(*pos1), ANIM_SHAKE_DURATION, size=size),
+            ShakeTween(self.board.get_piece(*pos2), cell_position(*pos2), ANIM_SHAKE_DURATION, direction=-1,
+                       size=size),
+        ], background)
+
+    def _queue_removal(self, event):
+        cells = event["cells"]
+        background = cells.copy()
+        cell_position = self.board.cell_position
+        tweens = []
+        for r, c in event["cells_cleared"]:
+            background[r, c] = EMPTY_CODE
+            tweens.append(Tween(self.board.decode_piece(cells[r, c]), cell_position(r, c), cell_position(r, c),
+                                ANIM_REMOVAL_DURATION, end_alpha=0, size=self.board.tile_size))
+
+        def apply_score():
+            # Score is applied as each cascade step is shown, so the HUD counts up with it
+            self.score += event["score"]
             if self.game_mode == MODE_TIME:
-                self.total_time += BONUS_TIME_PER_MATCH
-
-            # Removed: self._play_sound("match")
-            self._animate_removal(list(tiles_to_clear_in_this_cascade_step))
-
-            # 5. Identify new special tiles that will activate by being cleared in THIS step
-            specials_cleared_in_this_step_to_activate_next = set()
-            for r, c in tiles_to_clear_in_this_cascade_step:
-                piece_being_cleared = self.board.get_piece(r, c)
-                if piece_being_cleared in ALL_SPECIAL_TILE_TYPES:
-                    # If this special tile is being cleared, it should activate its effect in the NEXT cascade step.
-                    # For color bombs activated this way, target_type is None, leading to random color clear.
-                    specials_cleared_in_this_step_to_activate_next.add((r, c, None))
-
-            # 6. Remove tiles from the board
-            self.board.remove_tiles(tiles_to_clear_in_this_cascade_step)
-
-            # 7. Create newly generated special tiles (from previous matches)
-            for pos, type_name in new_special_tiles_to_create:
-                # Only place if the spot is currently empty (not cleared by another special that activates later)
-                if self.board.get_piece(pos[0], pos[1]) is None:
-                    self.board.set_piece(pos[0], pos[1], type_name)
-                    print(f"Created special tile {type_name} at {pos}")
-                else:
-                    print(f"Skipped creating {type_name} at {pos}, spot was occupied/cleared.")
-
-            # 8. Drop and Refill
-            self.board.drop_pieces()
-            self._animate_drop()
-            self.board.refill_grid()
-            # Removed: self._play_sound("drop") # Re-play drop sound for each cascade
-
-            # 9. Prepare for next iteration: Find new regular matches and add newly activated specials
-            current_matched_coords, special_creation_data = self.board.check_match()
-
-            # Add specials that were cleared in THIS step to the set for activation in the NEXT step.
-            activated_specials_this_round.update(specials_cleared_in_this_step_to_activate_next)
-
-        # After the cascade loop finishes
-        if not self.board.has_valid_moves():
-            self.board.reshuffle_board()
-
-    # --- Animation Methods (No changes needed in these, but removed internal sound calls) ---
-    def _animate_swap(self, pos1, pos2):
-        piece1_name = self.board.get_piece(pos1[0], pos1[1])
-        piece2_name = self.board.get_piece(pos2[0], pos2[1])
-
-        # Temporarily swap them back to animate from initial to swapped position
-        self.board.swap_tiles(pos1, pos2)  # Swap them back for animation starting point
-
-        x1_start, y1_start = pos1[1] * (TILE_SIZE + PADDING), pos1[0] * (TILE_SIZE + PADDING) + GAME_BOARD_OFFSET_Y
-        x2_start, y2_start = pos2[1] * (TILE_SIZE + PADDING), pos2[0] * (TILE_SIZE + PADDING) + GAME_BOARD_OFFSET_Y
-
-        dx = x2_start - x1_start
-        dy = y2_start - y1_start
-
-        for i in range(10):
-            self.screen.fill(MUTED_BLUE)
-            self._draw_game_play()
-
-            current_x1 = x1_start + (dx * i / 10)
-            current_y1 = y1_start + (dy * i / 10)
-            current_x2 = x2_start - (dx * i / 10)
-            current_y2 = y2_start - (dy * i / 10)
-
-            if piece1_name and piece1_name in self.board.images:
-                self.screen.blit(self.board.images[piece1_name], (current_x1, current_y1))
-            if piece2_name and piece2_name in self.board.images:
-                self.screen.blit(self.board.images[piece2_name], (current_x2, current_y2))
-
-            pygame.display.flip()
-            pygame.time.delay(ANIM_SWAP_SPEED)
-
-        # After animation, ensure tiles are in their final swapped state
-        self.board.swap_tiles(pos1, pos2)  # Swap them *back* to the final state for game logic
-
-    def _animate_shake(self, pos1, pos2):
-        shake_offsets = [5, -5, 3, -3, 0]
-
-        for offset in shake_offsets:
-            self.screen.fill(MUTED_BLUE)
-            self._draw_game_play()
-
-            x1, y1 = pos1[1] * (TILE_SIZE + PADDING), pos1[0] * (TILE_SIZE + PADDING) + GAME_BOARD_OFFSET_Y
-            x2, y2 = pos2[1] * (TILE_SIZE + PADDING), pos2[0] * (TILE_SIZE + PADDING) + GAME_BOARD_OFFSET_Y
-
-            piece1_name = self.board.get_piece(pos1[0], pos1[1])
-            piece2_name = self.board.get_piece(pos2[0], pos2[1])
-
-            if piece1_name and piece1_name in self.board.images:
-                self.screen.blit(self.board.images[piece1_name], (x1 + offset, y1))
-            if piece2_name and piece2_name in self.board.images:
-                self.screen.blit(self.board.images[piece2_name], (x2 - offset, y2))
-
-            pygame.display.flip()
-            pygame.time.delay(ANIM_SHAKE_SPEED)
-
-    def _animate_removal(self, matches):
-        fading_surfaces = []
-        for r, c in matches:
-            x = c * (TILE_SIZE + PADDING)
-            y = r * (TILE_SIZE + PADDING) + GAME_BOARD_OFFSET_Y
-            piece_name = self.board.get_piece(r, c)
-            if piece_name and piece_name in self.board.images:
-                fading_surfaces.append((self.board.images[piece_name].copy(), (x, y)))
-
-        for alpha in range(255, 0, -25):
-            self.screen.fill(MUTED_BLUE)
-            self._draw_game_play()
-
-            for surface, pos in fading_surfaces:
-                surface.set_alpha(alpha)
-                self.screen.blit(surface, pos)
-
-            pygame.display.flip()
-            pygame.time.delay(ANIM_REMOVAL_SPEED)
-
-    def _animate_drop(self):
-        for _ in range(3):
-            self.screen.fill(MUTED_BLUE)
-            self._draw_game_play()
-            pygame.display.flip()
-            pygame.time.delay(ANIM_DROP_SPEED)
-        # Removed: self._play_sound("drop")
\ No newline at end of file
+                self.total_time += event["bonus_time"]
+
+        self.animations.add_phase(tweens, background, on_start=apply_score)
+
+    def _queue_drop(self, drop_event, refill_event):
+        # Existing pieces fall from their source rows; refilled pieces fall in from above the board
+        # by their column's fall distance. All falls in a cascade step run together.
+        after = refill_event["cells"]
+        falls = [(col, from_row, to_row) for col, from_row, to_row in drop_event["moves"]]
+        falls += [(col, row - drop_event["fall_distances"][col], row) for row, col in refill_event["cells_filled"]]
+
+        background = after.copy()
+        cell_position = self.board.cell_position
+        tweens = []
+        for col, from_row, to_row in falls:
+            background[to_row, col] = EMPTY_CODE
+            tweens.append(Tween(self.board.decode_piece(after[to_row, col]), cell_position(from_row, col),
+                                cell_position(to_row, col), ANIM_DROP_DURATION_PER_ROW * (to_row - from_row),
+                                easing=ease_in_quad, size=self.board.tile_size))
+        self.animations.add_phase(tweens, background)
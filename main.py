@@ -1,5 +1,27 @@
+import time
+
+start_time = time.perf_counter()  # Before the imports, pygame's alone is a good part of the startup time
+
+import argparse
+import asyncio
+import sys
 from game import Game
 
-if __name__ == "__main__":
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pygame Match-3")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print the time to the first frame and quit, with exit status 1 if it is over "
+                             "STARTUP_BUDGET_MS")
+    args = parser.parse_args(argv)
+    imported_time = time.perf_counter()
+
     game = Game()
-    game.run()
\ No newline at end of file
+    if args.startup_time:
+        game.measure_startup(start_time, imported_time)
+    asyncio.run(game.run())
+    return game.exit_status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
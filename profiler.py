@@ -0,0 +1,134 @@
+"""
+Frame profiler: named timing sections and counters per frame, for the in-game overlay (F3) and for
+offline analysis as a CSV of frames or a Chrome trace (F4; open chrome://tracing or ui.perfetto.dev).
+
+Everything is a no-op until enabled, so the hooks can stay in the game loop and the board logic.
+"""
+import csv
+import json
+import time
+from collections import deque
+from itertools import islice
+from constants import *
+
+
+class _Section:
+    # Context manager returned by Profiler.section()
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._record(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+class _NoSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SECTION = _NoSection()
+
+
+class Profiler:
+    """
+    Records, while enabled, one entry per frame in self.frames ({"start", "duration", "sections": {name:
+    seconds}, "counts": {name: n}}, the last PROFILER_MAX_FRAMES frames) and every section as a trace event
+    (up to PROFILER_MAX_TRACE_EVENTS). Sections may nest; a frame's section times are totals per name.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.frames = deque(maxlen=PROFILER_MAX_FRAMES)
+        self.trace_events = []  # (name, start, duration), in seconds since self._origin
+        self.dropped_trace_events = 0
+        self._frame = None
+        self._origin = time.perf_counter()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self._frame = None
+
+    def clear(self):
+        self.frames.clear()
+        self.trace_events = []
+        self.dropped_trace_events = 0
+
+    def begin_frame(self):
+        if self.enabled:
+            self._frame = {"start": time.perf_counter() - self._origin, "duration": 0.0, "sections": {},
+                           "counts": {}}
+
+    def end_frame(self):
+        frame = self._frame
+        if frame is None:
+            return
+        frame["duration"] = time.perf_counter() - self._origin - frame["start"]
+        self.frames.append(frame)
+        self._record_trace("frame", frame["start"], frame["duration"])
+        self._frame = None
+
+    def section(self, name):
+        """with profiler.section("draw"): ... times the block, if enabled."""
+        return _Section(self, name) if self.enabled else _NO_SECTION
+
+    def record(self, name, start):
+        """Records a section that began at start (a time.perf_counter() value) and ends now."""
+        if self.enabled:
+            self._record(name, start, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        if self._frame is not None:
+            counts = self._frame["counts"]
+            counts[name] = counts.get(name, 0) + n
+
+    def recent_frames(self, n):
+        """The last n frames, oldest first."""
+        return list(islice(reversed(self.frames), n))[::-1]
+
+    def _record(self, name, start, duration):
+        if self._frame is not None:
+            sections = self._frame["sections"]
+            sections[name] = sections.get(name, 0.0) + duration
+        self._record_trace(name, start - self._origin, duration)
+
+    def _record_trace(self, name, start, duration):
+        if len(self.trace_events) < PROFILER_MAX_TRACE_EVENTS:
+            self.trace_events.append((name, start, duration))
+        else:
+            self.dropped_trace_events += 1
+
+    # --- Export ---
+    def export_chrome_trace(self, path):
+        """Writes the trace events in the Chrome trace event format (complete events, microseconds)."""
+        events = [{"name": name, "ph": "X", "ts": round(start * 1e6, 1), "dur": round(duration * 1e6, 1),
+                   "pid": 1, "tid": 1} for name, start, duration in self.trace_events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped_events": self.dropped_trace_events}}, f)
+
+    def export_csv(self, path):
+        """Writes one row per recorded frame: start and duration, then every section (ms) and counter."""
+        sections = sorted({name for frame in self.frames for name in frame["sections"]})
+        counters = sorted({name for frame in self.frames for name in frame["counts"]})
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame_start_s", "frame_ms"] + [f"{name}_ms" for name in sections] + counters)
+            for frame in self.frames:
+                writer.writerow([round(frame["start"], 6), round(frame["duration"] * 1000, 3)] +
+                                [round(frame["sections"].get(name, 0.0) * 1000, 3) for name in sections] +
+                                [frame["counts"].get(name, 0) for name in counters])
+
+
+# Shared by the game loop, the engine and the board logic
+profiler = Profiler()
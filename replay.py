@@ -0,0 +1,115 @@
+"""
+Compact binary game replays, and a headless fast-forward replayer.
+
+A replay is everything needed to re-simulate a session: the board seed, mode, theme, board size and
+every swap the player made with the game time it happened at. Since all randomness comes from the
+board's seeded RNG, replaying the swaps through engine.resolve_swap reproduces the session exactly.
+
+    python replay.py last_game.m3r   # re-simulate and report score and the slowest turns
+
+File layout (little endian):
+    header:  magic b"M3R", version u8, seed u64, mode u8, rows u16, cols u16, theme length u8, theme utf-8
+    swaps:   time_ms u32, row u16, col u16, direction u8
+             (row, col) is the tile the player picked first, direction the neighbour picked second:
+             0 = right, 1 = below, 2 = left, 3 = above. The order matters, a special combo fires where
+             the player dropped the tile.
+"""
+import argparse
+import struct
+import sys
+import time
+
+from board_state import BoardState
+from engine import resolve_swap
+from constants import *
+
+REPLAY_MAGIC = b"M3R"
+REPLAY_VERSION = 2  # Version 1 stored swaps without the order the tiles were picked in
+_HEADER = struct.Struct("<3sBQBHHB")
+_SWAP = struct.Struct("<IHHB")
+_MODES = [MODE_TIME, MODE_MOVES]
+_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # Second tile relative to the first, by direction code
+
+
+class Replay:
+    """A recorded session. swaps is a list of (time_ms, pos1, pos2), in the order the player picked the tiles."""
+
+    def __init__(self, seed, mode, theme, rows, cols, swaps=None):
+        self.seed = seed
+        self.mode = mode
+        self.theme = theme
+        self.rows = rows
+        self.cols = cols
+        self.swaps = swaps if swaps is not None else []
+
+    def record_swap(self, elapsed_time, pos1, pos2):
+        """Adds a swap made elapsed_time seconds into the game, on the game clock (stopped while moves play)."""
+        self.swaps.append((int(elapsed_time * 1000), pos1, pos2))
+
+    def to_bytes(self):
+        theme = self.theme.encode("utf-8")
+        parts = [_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.seed, _MODES.index(self.mode),
+                              self.rows, self.cols, len(theme)), theme]
+        for time_ms, (row, col), (row2, col2) in self.swaps:
+            parts.append(_SWAP.pack(time_ms, row, col, _DIRECTIONS.index((row2 - row, col2 - col))))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, seed, mode, rows, cols, theme_length = _HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"Not a version {REPLAY_VERSION} replay")
+        offset = _HEADER.size
+        theme = data[offset:offset + theme_length].decode("utf-8")
+        swaps = []
+        for time_ms, row, col, direction in _SWAP.iter_unpack(data[offset + theme_length:]):
+            d_row, d_col = _DIRECTIONS[direction]
+            swaps.append((time_ms, (row, col), (row + d_row, col + d_col)))
+        return cls(seed, _MODES[mode], theme, rows, cols, swaps)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def replay_session(replay):
+    """
+    Re-simulates a replay headlessly as fast as possible.
+    Returns the final BoardState and a list of (time_ms, TurnResult, seconds spent in resolve_swap) per swap.
+    """
+    board = BoardState(THEMES[replay.theme], replay.rows, replay.cols, seed=replay.seed)
+    turns = []
+    for time_ms, pos1, pos2 in replay.swaps:
+        start = time.perf_counter()
+        result = resolve_swap(board, pos1, pos2)
+        turns.append((time_ms, result, time.perf_counter() - start))
+    return board, turns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-simulate a recorded game.")
+    parser.add_argument("replay", nargs="?", default=REPLAY_FILE, help="replay file")
+    parser.add_argument("--slowest", type=int, default=5, help="how many of the slowest turns to list")
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.replay)
+    start = time.perf_counter()
+    board, turns = replay_session(replay)
+    elapsed = time.perf_counter() - start
+
+    print(f"{replay.theme}, {replay.mode} mode, {replay.cols}x{replay.rows}, seed {replay.seed}")
+    print(f"{len(turns)} swaps ({sum(result.valid for _, result, _ in turns)} valid), "
+          f"score {sum(result.score_delta for _, result, _ in turns)}, re-simulated in {elapsed * 1000:.1f} ms")
+    for index, (time_ms, result, seconds) in sorted(enumerate(turns), key=lambda turn: -turn[1][2])[:args.slowest]:
+        print(f"  swap #{index} at {time_ms / 1000:.2f}s: {seconds * 1000:.2f} ms, "
+              f"{result.cascade_steps} cascade steps{', reshuffled' if result.reshuffled else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Headless batch self-play, for tuning POINTS_PER_TILE, BONUS_TIME_PER_MATCH, DEFAULT_MOVES and the
+special tile rules without playing by hand.
+
+    python simulate.py --games 1000 --policy greedy
+    python simulate.py --games 200 --policy lookahead --workers 4 --output lookahead.jsonl
+
+Each game is played in moves mode (--moves swaps, DEFAULT_MOVES by default) by a move-selection
+policy. Games run in a process pool; every game seeds the RNG from (--seed, game number), so a run
+gives the same results whatever the worker count or scheduling. One JSON line per game is written
+to --output as games finish, followed by a summary line, which is also printed.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+from board_state import BoardState
+from engine import resolve_swap, EVENT_SPECIAL_CREATED
+from constants import *
+
+
+# --- Policies: policy(board) -> one of candidate_moves(board) ---
+def candidate_moves(board):
+    """The swaps a player can make: every matching swap plus every swap that moves a special tile, as in the solver."""
+    moves = board.valid_moves()
+    return moves + [swap for swap in board.special_swaps() if swap not in moves]
+
+
+def random_policy(board):
+    return random.choice(candidate_moves(board))
+
+
+def _score_of(board, move):
+    # Plays the move on a copy; refills are random, so this is one sample of what the move is worth.
+    # The copy gets a fresh seed, otherwise it would see the refills the real board is about to get.
+    trial = board.copy(seed=random.getrandbits(64))
+    return resolve_swap(trial, *move).score_delta, trial
+
+
+def greedy_policy(board):
+    """The move that scores the most right away."""
+    return max(candidate_moves(board), key=lambda move: _score_of(board, move)[0])
+
+
+def lookahead_policy(board):
+    """The move that scores the most together with the best greedy follow-up move."""
+    def two_move_score(move):
+        score, after = _score_of(board, move)
+        return score + max(_score_of(after, next_move)[0] for next_move in candidate_moves(after))
+    return max(candidate_moves(board), key=two_move_score)
+
+
+POLICIES = {"random": random_policy, "greedy": greedy_policy, "lookahead": lookahead_policy}
+
+
+def play_game(job):
+    """Plays one game and returns its record. Runs in a worker process, so it only takes plain data."""
+    game_number, seed, policy_name, moves, theme, rows, cols = job
+    random.seed(f"{seed}/{game_number}")
+    policy = POLICIES[policy_name]
+    board = BoardState(THEMES[theme], rows, cols, seed=random.getrandbits(64))
+
+    record = {"type": "game", "game": game_number, "policy": policy_name, "score": 0, "bonus_time": 0,
+              "cascade_lengths": [], "specials_created": {}, "reshuffles": 0}
+    specials = Counter()
+    for _ in range(moves):
+        result = resolve_swap(board, *policy(board))
+        record["score"] += result.score_delta
+        record["bonus_time"] += result.bonus_time
+        record["cascade_lengths"].append(result.cascade_steps)
+        record["reshuffles"] += result.reshuffled
+        specials.update(event["special_type"] for event in result.events if event["type"] == EVENT_SPECIAL_CREATED)
+    record["specials_created"] = dict(specials)
+    return record
+
+
+def _distribution(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    deciles = statistics.quantiles(values, n=10, method="inclusive") if len(values) > 1 else [values[0]] * 9
+    return {"mean": round(statistics.fmean(values), 2), "stdev": round(statistics.pstdev(values), 2),
+            "min": values[0], "p10": deciles[0], "median": statistics.median(values), "p90": deciles[-1],
+            "max": values[-1]}
+
+
+def summarize(records):
+    """Aggregate distributions over a list of game records."""
+    cascade_lengths = [length for record in records for length in record["cascade_lengths"]]
+    specials_by_type = Counter()
+    for record in records:
+        specials_by_type.update(record["specials_created"])
+    total_moves = len(cascade_lengths)
+    return {
+        "type": "summary",
+        "games": len(records),
+        "score": _distribution([record["score"] for record in records]),
+        "bonus_time": _distribution([record["bonus_time"] for record in records]),
+        "cascade_length_histogram": dict(sorted(Counter(cascade_lengths).items())),
+        "cascade_length": _distribution(cascade_lengths),
+        "specials_per_game": _distribution([sum(record["specials_created"].values()) for record in records]),
+        "specials_by_type": dict(specials_by_type),
+        "reshuffles_per_game": _distribution([record["reshuffles"] for record in records]),
+        "reshuffles_per_move": round(sum(record["reshuffles"] for record in records) / total_moves, 4)
+        if total_moves else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play games headlessly and collect score statistics.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy", help="move-selection policy")
+    parser.add_argument("--moves", type=int, default=DEFAULT_MOVES, help="swaps per game")
+    parser.add_argument("--theme", choices=list(THEMES), default=list(THEMES)[0])
+    parser.add_argument("--rows", type=int, default=GRID_SIZE)
+    parser.add_argument("--cols", type=int, default=None, help="defaults to --rows")
+    parser.add_argument("--seed", default="0", help="base seed; game i uses (seed, i)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", default="simulation_results.jsonl", help="JSON lines results file")
+    args = parser.parse_args(argv)
+
+    jobs = [(i, args.seed, args.policy, args.moves, args.theme, args.rows, args.cols) for i in range(args.games)]
+    records = []
+    start = time.perf_counter()
+    with open(args.output, "w") as out, multiprocessing.Pool(args.workers) as pool:
+        # Records are streamed in completion order; "game" says which one it is
+        for record in pool.imap_unordered(play_game, jobs):
+            records.append(record)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+        summary = summarize(records)
+        summary["elapsed_seconds"] = round(time.perf_counter() - start, 2)
+        out.write(json.dumps(summary) + "\n")
+
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Look-ahead solver: beam search over whole turns (cascades and special activations included, played
+by engine.resolve_swap), with Zobrist position keys and a bounded transposition table.
+
+Refills are random, so the solver plays a model of the game in which the refills after a swap are
+fixed by the position and the swap (the trial board's RNG is seeded from both). The same position
+and swap then always lead to the same result, which is what lets the table reuse work: across the
+lines of one search, and across consecutive searches when a whole game is played by the solver.
+
+Its main use is estimating targets for moves-mode levels:
+
+    python solver.py --games 20 --moves 15      # score distribution after 15 swaps, suggested target
+    python solver.py --games 20 --target 600    # swaps needed to reach 600 points
+"""
+import argparse
+import heapq
+import json
+import random
+import statistics
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from board_state import BoardState, SPECIAL_CODE_BASE
+from engine import resolve_swap
+from constants import *
+
+
+class ZobristHasher:
+    """64-bit position keys for one board size: the XOR of a random number per (cell, piece code)."""
+
+    def __init__(self, rows, cols, seed=0):
+        code_count = SPECIAL_CODE_BASE + len(ALL_SPECIAL_TILE_TYPES)
+        self._table = np.random.default_rng(seed).integers(0, 2 ** 64, size=(rows * cols, code_count),
+                                                           dtype=np.uint64)
+        self._cell_index = np.arange(rows * cols)
+
+    def key(self, cells):
+        return int(np.bitwise_xor.reduce(self._table[self._cell_index, cells.ravel()]))
+
+
+class TranspositionTable:
+    """
+    Bounded map from (position key, swap) to what the swap did, with LRU eviction. Entries are
+    compact (the board's cell bytes, not the board), see Solver.play.
+    """
+
+    def __init__(self, max_entries=SOLVER_TABLE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Solver:
+    """
+    Searches depth swaps ahead, keeping the beam_width best scoring lines after each swap. Each
+    position tries its branching best ranked swaps (BoardState.ranked_moves) plus every swap that
+    moves a special tile.
+    """
+
+    def __init__(self, beam_width=SOLVER_BEAM_WIDTH, depth=SOLVER_DEPTH, branching=SOLVER_BRANCHING,
+                 table_size=SOLVER_TABLE_SIZE, seed=0):
+        self.beam_width = beam_width
+        self.depth = depth
+        self.branching = branching
+        self.seed = seed
+        self.table = TranspositionTable(table_size)
+        self.evaluations = 0  # Swaps actually played out, i.e. not answered by the table
+        self._hashers = {}  # (rows, cols) -> ZobristHasher
+
+    def position_key(self, board):
+        hasher = self._hashers.get((board.rows, board.cols))
+        if hasher is None:
+            hasher = self._hashers[(board.rows, board.cols)] = ZobristHasher(board.rows, board.cols, self.seed)
+        return hasher.key(board.cells)
+
+    def candidate_moves(self, board):
+        moves = [(move.pos1, move.pos2) for move in board.ranked_moves()[:self.branching]]
+        return moves + [swap for swap in board.special_swaps() if swap not in moves]
+
+    def play(self, board, key, move):
+        """
+        Plays a swap in the solver's model of the game. Returns (points scored, board after the
+        swap, its key); board itself is not changed. key is board's position_key().
+        """
+        entry = self.table.get((key, move))
+        if entry is not None:
+            score, cells, after_key = entry
+            # A whole board with its indexes and move caches is some 20 KB at 7x7, so the table only
+            # keeps the cells and the board is rebuilt on a hit
+            return score, board.with_cells(cells), after_key
+        after = board.copy(seed=hash((self.seed, key) + move))
+        score = resolve_swap(after, *move).score_delta
+        self.evaluations += 1
+        after_key = self.position_key(after)
+        self.table.put((key, move), (score, after.cells.tobytes(), after_key))
+        return score, after, after_key
+
+    def search(self, board, key=None):
+        """The first swap of the best scoring line and that line's points, or (None, 0) without swaps."""
+        beam = [(0, None, board, self.position_key(board) if key is None else key)]
+        for _ in range(self.depth):
+            lines = {}
+            for score, first_move, position, position_key in beam:
+                for move in self.candidate_moves(position):
+                    points, after, after_key = self.play(position, position_key, move)
+                    line = (score + points, first_move or move, after, after_key)
+                    # Lines that transpose into the same position are one line, the best scoring one
+                    if after_key not in lines or line[0] > lines[after_key][0]:
+                        lines[after_key] = line
+            if not lines:
+                break
+            beam = heapq.nlargest(self.beam_width, lines.values(), key=lambda line: line[0])
+        best = max(beam, key=lambda line: line[0])
+        return best[1], best[0]
+
+
+def play_game(solver, board, moves):
+    """Lets the solver play moves swaps from board (not changed); returns the total score after each swap."""
+    key = solver.position_key(board)
+    totals = []
+    total = 0
+    for _ in range(moves):
+        move, _ = solver.search(board, key)
+        if move is None:
+            break
+        # Already in the table from the search, as are the first plies of the next search
+        points, board, key = solver.play(board, key, move)
+        total += points
+        totals.append(total)
+    return totals
+
+
+def estimate_targets(games, moves, target=None):
+    """
+    Level targets from solver games (lists of running totals as returned by play_game). Without a
+    target, suggests the score the solver reached in three games out of four.
+    """
+    finals = sorted(totals[-1] if totals else 0 for totals in games)
+    quartiles = statistics.quantiles(finals, n=4, method="inclusive") if len(finals) > 1 else finals * 3
+    if target is None:
+        target = int(quartiles[0]) // POINTS_PER_TILE * POINTS_PER_TILE
+    moves_needed = [next(i + 1 for i, total in enumerate(totals) if total >= target)
+                    for totals in games if totals and totals[-1] >= target]
+    return {
+        "games": len(games),
+        "moves": moves,
+        "score": {"min": finals[0], "p25": quartiles[0], "median": quartiles[1], "p75": quartiles[2],
+                  "max": finals[-1]},
+        "target_score": target,
+        "games_reaching_target": len(moves_needed),
+        "moves_to_target": {"median": statistics.median(moves_needed), "max": max(moves_needed)}
+        if moves_needed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate moves-mode level targets with the look-ahead solver.")
+    parser.add_argument("--games", type=int, default=20, help="number of boards to play")
+    parser.add_argument("--moves", type=int, default=DEFAULT_MOVES, help="swaps per game")
+    parser.add_argument("--target", type=int, default=None, help="score target (default: suggested from the games)")
+    parser.add_argument("--theme", choices=list(THEMES), default=list(THEMES)[0])
+    parser.add_argument("--rows", type=int, default=GRID_SIZE)
+    parser.add_argument("--cols", type=int, default=None, help="defaults to --rows")
+    parser.add_argument("--beam", type=int, default=SOLVER_BEAM_WIDTH, help="lines kept per ply")
+    parser.add_argument("--depth", type=int, default=SOLVER_DEPTH, help="plies searched ahead")
+    parser.add_argument("--branching", type=int, default=SOLVER_BRANCHING, help="ranked swaps tried per position")
+    parser.add_argument("--seed", default="0", help="base seed; board i uses (seed, i)")
+    args = parser.parse_args(argv)
+
+    solver = Solver(args.beam, args.depth, args.branching, seed=random.Random(args.seed).getrandbits(64))
+    games = []
+    start = time.perf_counter()
+    for i in range(args.games):
+        board = BoardState(THEMES[args.theme], args.rows, args.cols,
+                           seed=random.Random(f"{args.seed}/{i}").getrandbits(64))
+        games.append(play_game(solver, board, args.moves))
+    elapsed = time.perf_counter() - start
+
+    summary = estimate_targets(games, args.moves, args.target)
+    lookups = solver.table.hits + solver.table.misses
+    summary["evaluations"] = solver.evaluations
+    summary["evaluations_per_second"] = round(solver.evaluations / elapsed) if elapsed else 0
+    summary["table_hit_rate"] = round(solver.table.hits / lookups, 3) if lookups else 0
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())